@@ -36,9 +36,9 @@ class AdminCog(commands.Cog, BaseLockHandler, BaseResponseHandler):
         
         # Initialize services dengan cache manager
         self.cache_manager = CacheManager()
-        self.balance_service = BalanceManagerService(bot)
-        self.product_service = ProductManagerService(bot)
-        self.trx_manager = TransactionManager(bot)
+        self.balance_service = BalanceManagerService.get(bot)
+        self.product_service = ProductManagerService.get(bot)
+        self.trx_manager = TransactionManager.get(bot)
         
         # Load admin configuration dengan proper error handling
         try:
@@ -79,8 +79,8 @@ class AdminCog(commands.Cog, BaseLockHandler, BaseResponseHandler):
             return False
 
         ctx.is_being_processed = True
-        cache_key = f"admin_command_{command_name}_{ctx.author.id}"
-        lock = await self.acquire_lock(cache_key)
+        lock_key = ("admin_command", command_name, ctx.author.id)
+        lock = await self.acquire_lock(lock_key)
 
         if not lock:
             await self.send_response_once(
@@ -118,7 +118,7 @@ class AdminCog(commands.Cog, BaseLockHandler, BaseResponseHandler):
             await self.send_response_once(ctx, embed=error_embed)
             return False
         finally:
-            self.release_lock(cache_key)
+            self.release_lock(lock_key)
             delattr(ctx, 'is_being_processed')
 
     async def _process_stock_file(self, attachment) -> List[str]:
@@ -392,9 +392,6 @@ class AdminCog(commands.Cog, BaseLockHandler, BaseResponseHandler):
                 f"Stock added for {code} by {ctx.author}: "
                 f"{added_count} success, {failed_count} failed"
             )
-            
-            # Invalidate stock cache
-            await self.cache_manager.delete(f"stock_{code}")
 
         await self._process_command(ctx, "addstock", execute)
 
@@ -2,20 +2,33 @@ import sqlite3
 import logging
 import time
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Iterator, Optional, Sequence, TypeVar
 from pathlib import Path
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def get_connection(max_retries: int = 3, timeout: int = 5) -> sqlite3.Connection:
+def get_connection(
+    max_retries: int = 3,
+    timeout: int = 5,
+    check_same_thread: bool = True,
+    cached_statements: int = 128
+) -> sqlite3.Connection:
     """
     Get SQLite database connection with retry mechanism
     
     Args:
         max_retries (int): Maximum number of connection attempts
         timeout (int): Connection timeout in seconds
+        check_same_thread (bool): Passed to sqlite3.connect; pooled
+            connections disable it so they can move between threads
+        cached_statements (int): Size of the connection's prepared
+            statement LRU; queries reusing the same SQL string skip
+            re-preparing
         
     Returns:
         sqlite3.Connection: Database connection object
@@ -33,13 +46,18 @@ def get_connection(max_retries: int = 3, timeout: int = 5) -> sqlite3.Connection
 
     for attempt in range(max_retries):
         try:
-            conn = sqlite3.connect('shop.db', timeout=timeout)
+            conn = sqlite3.connect(
+                'shop.db',
+                timeout=timeout,
+                check_same_thread=check_same_thread,
+                cached_statements=cached_statements
+            )
             conn.row_factory = sqlite3.Row
             
             # Configure database settings
             cursor = conn.cursor()
             cursor.execute("PRAGMA foreign_keys = ON")
-            cursor.execute("PRAGMA journal_mode = DELETE")  # More stable than WAL
+            cursor.execute("PRAGMA journal_mode = WAL")     # Readers don't block the writer
             cursor.execute("PRAGMA busy_timeout = 60000")   # 60 second timeout
             cursor.execute("PRAGMA synchronous = NORMAL")   # Balance performance and safety
             cursor.execute("PRAGMA temp_store = MEMORY")    # Store temp tables in memory
@@ -52,6 +70,135 @@ def get_connection(max_retries: int = 3, timeout: int = 5) -> sqlite3.Connection
             logger.warning(f"Database connection attempt {attempt + 1} failed, retrying... Error: {e}")
             time.sleep(0.1 * (attempt + 1))
 
+class ConnectionPool:
+    """
+    Fixed-size pool of long-lived SQLite connections
+    
+    Connections are opened lazily up to `size` and handed out one caller at
+    a time, so each keeps a warm page cache without paying open/close per
+    query. Acquiring blocks while every connection is in use.
+    
+    SQLite in WAL mode allows many readers but only one writer, so writes
+    go through a single dedicated connection (see writer()) instead of
+    competing for the write lock from random pooled connections.
+    """
+
+    def __init__(self, size: int = 5, cache_size_kib: int = 20000, cached_statements: int = 256):
+        self.size = size
+        self.cache_size_kib = cache_size_kib
+        self.cached_statements = cached_statements
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = get_connection(check_same_thread=False, cached_statements=self.cached_statements)
+        # Safe with WAL: only the last commits may be lost on power failure
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA cache_size = -{self.cache_size_kib}")
+        conn.execute("PRAGMA mmap_size = 268435456")
+        return conn
+
+    @contextmanager
+    def acquire(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection and return it to the pool afterwards"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Borrow the single writer connection, one caller at a time"""
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._open()
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+
+    def close(self) -> None:
+        """Close all idle connections and the writer"""
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+T = TypeVar("T")
+
+cache_pool = ConnectionPool(size=os.cpu_count() or 5)
+
+def fetch_rows(query: str, params: Sequence = (), one: bool = False):
+    """
+    Run a read-only query on a pooled connection
+    
+    Safe to call from worker threads, e.g. via asyncio.to_thread, so reads
+    do not block the event loop.
+    
+    Returns:
+        A single sqlite3.Row (or None) if `one`, otherwise a list of rows
+    """
+    with cache_pool.acquire() as conn:
+        cursor = conn.execute(query, params)
+        return cursor.fetchone() if one else cursor.fetchall()
+
+def run_in_transaction(func: Callable[..., T], *args, max_retries: int = 5) -> T:
+    """
+    Call func(conn, *args) on the writer connection inside one transaction
+    
+    The transaction starts with BEGIN IMMEDIATE so SQLite's write lock is
+    taken up front, commits when func returns and rolls back if it raises.
+    If another connection holds the lock, it retries with exponential
+    backoff (20ms doubling, capped at 500ms), sleeping only after the
+    writer connection has been released. Like fetch_rows, meant to be
+    called via asyncio.to_thread.
+    """
+    delay = 0.02
+    for attempt in range(max_retries):
+        try:
+            with cache_pool.writer() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                with conn:
+                    return func(conn, *args)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or attempt == max_retries - 1:
+                raise
+            logger.warning(f"Database locked, retrying transaction in {delay * 1000:.0f}ms")
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
 def setup_database():
     """Initialize and setup all database tables"""
     conn = None
@@ -65,8 +212,14 @@ def setup_database():
         if db_path.exists():
             backup_path = f"shop.db.backup_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
             try:
-                import shutil
-                shutil.copy2('shop.db', backup_path)
+                # Backup API includes pages still sitting in the WAL file
+                src = sqlite3.connect('shop.db')
+                dst = sqlite3.connect(backup_path)
+                try:
+                    src.backup(dst)
+                finally:
+                    dst.close()
+                    src.close()
                 logger.info(f"Created database backup: {backup_path}")
             except Exception as e:
                 logger.warning(f"Failed to create backup: {e}")
@@ -81,7 +234,7 @@ def setup_database():
             # 1. Admin System Tables
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS users (
-                    growid TEXT PRIMARY KEY,
+                    growid TEXT COLLATE BINARY PRIMARY KEY,
                     balance_wl INTEGER DEFAULT 0,
                     balance_dl INTEGER DEFAULT 0,
                     balance_bgl INTEGER DEFAULT 0,
@@ -93,7 +246,7 @@ def setup_database():
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS user_growid (
                     discord_id TEXT PRIMARY KEY,
-                    growid TEXT NOT NULL,
+                    growid TEXT NOT NULL COLLATE BINARY,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (growid) REFERENCES users(growid) ON DELETE CASCADE
                 )
@@ -133,6 +286,12 @@ def setup_database():
                     details TEXT NOT NULL,
                     old_balance TEXT,
                     new_balance TEXT,
+                    old_wl INTEGER,
+                    old_dl INTEGER,
+                    old_bgl INTEGER,
+                    new_wl INTEGER,
+                    new_dl INTEGER,
+                    new_bgl INTEGER,
                     items_count INTEGER DEFAULT 0,
                     total_price INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -140,6 +299,13 @@ def setup_database():
                 )
             """)
 
+            # Add integer balance columns to transactions tables created before them
+            cursor.execute("PRAGMA table_info(transactions)")
+            transaction_columns = {row['name'] for row in cursor.fetchall()}
+            for column in ('old_wl', 'old_dl', 'old_bgl', 'new_wl', 'new_dl', 'new_bgl'):
+                if column not in transaction_columns:
+                    cursor.execute(f"ALTER TABLE transactions ADD COLUMN {column} INTEGER")
+
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS world_info (
                     id INTEGER PRIMARY KEY CHECK (id = 1),
@@ -204,9 +370,20 @@ def setup_database():
                     key TEXT PRIMARY KEY,
                     value TEXT NOT NULL,
                     expires_at TIMESTAMP NOT NULL,
+                    expires_at_i INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+
+            # Add unix-epoch expiry to cache tables created before it
+            cursor.execute("PRAGMA table_info(cache_table)")
+            cache_columns = {row['name'] for row in cursor.fetchall()}
+            if 'expires_at_i' not in cache_columns:
+                cursor.execute("ALTER TABLE cache_table ADD COLUMN expires_at_i INTEGER")
+                cursor.execute("""
+                    UPDATE cache_table
+                    SET expires_at_i = CAST(strftime('%s', expires_at) AS INTEGER)
+                """)
             # 2. Statistics System Tables
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS activity_logs (
@@ -527,7 +704,11 @@ def setup_database():
                 ("idx_stock_product_code", "stock(product_code)"),
                 ("idx_stock_status", "stock(status)"),
                 ("idx_stock_content", "stock(content)"),
-                ("idx_transactions_growid", "transactions(growid)"),
+                # Serves available-stock lookups: filter, count and FIFO order from the index
+                ("idx_stock_pcs", "stock(product_code, status, added_at)"),
+                # Product lookups compare code COLLATE NOCASE, which the PK index can't serve
+                ("idx_products_code_nc", "products(code COLLATE NOCASE)"),
+                ("idx_tx_growid_created", "transactions(growid, created_at DESC)"),
                 ("idx_transactions_created", "transactions(created_at)"),
                 ("idx_blacklist_growid", "blacklist(growid)"),
                 ("idx_admin_logs_admin", "admin_logs(admin_id)"),
@@ -535,7 +716,7 @@ def setup_database():
                 ("idx_user_activity_discord", "user_activity(discord_id)"),
                 ("idx_user_activity_type", "user_activity(activity_type)"),
                 ("idx_role_permissions_role", "role_permissions(role_id)"),
-                ("idx_cache_expires", "cache_table(expires_at)"),
+                ("idx_cache_expires_i", "cache_table(expires_at_i)"),
 
                 # Stats System Indexes
                 ("idx_activity_logs_guild", "activity_logs(guild_id)"),
@@ -707,7 +888,9 @@ def verify_database():
             raise sqlite3.Error("Database integrity check failed")
 
         # Clean expired cache entries
-        cursor.execute("DELETE FROM cache_table WHERE expires_at < CURRENT_TIMESTAMP")
+        cursor.execute(
+            "DELETE FROM cache_table WHERE expires_at_i < CAST(strftime('%s', 'now') AS INTEGER)"
+        )
         
         # Vacuum database to optimize storage
         cursor.execute("VACUUM")
@@ -752,7 +935,8 @@ if __name__ == "__main__":
             
             # Recreate database
             try:
-                Path('shop.db').unlink(missing_ok=True)
+                for suffix in ('', '-wal', '-shm'):
+                    Path(f'shop.db{suffix}').unlink(missing_ok=True)
                 setup_database()
                 if verify_database():
                     logger.info("Database successfully recreated")
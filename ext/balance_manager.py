@@ -1,6 +1,7 @@
 import logging
 import asyncio
-from typing import Dict, Optional
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from datetime import datetime
 
 import discord
@@ -12,154 +13,241 @@ from .constants import (
     CURRENCY_RATES, # Untuk konversi mata uang
     CACHE_TIMEOUT  # Untuk cache timeout
 )
-from database import get_connection
+from database import cache_pool, fetch_rows, run_in_transaction
 from .base_handler import BaseLockHandler
-from .cache_manager import CacheManager
+from .cache_manager import CacheManager, async_ttl_cache
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of balance writes committed together in one transaction
+WRITE_BATCH_SIZE = 16
 
 class BalanceManagerService(BaseLockHandler):
     _instance = None
-    _instance_lock = asyncio.Lock()
+    _instance_lock = threading.Lock()
 
     def __new__(cls, bot):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.initialized = False
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._setup(bot)
+                    # Publish only after setup so no caller sees a half-built instance
+                    cls._instance = instance
         return cls._instance
 
     def __init__(self, bot):
-        if not self.initialized:
-            super().__init__()  # Initialize BaseLockHandler
-            self.bot = bot
-            self.logger = logging.getLogger("BalanceManagerService")
-            self.cache_manager = CacheManager()
-            self.initialized = True
+        # State is built exactly once in __new__; repeated construction is a no-op
+        pass
+
+    @classmethod
+    def get(cls, bot) -> "BalanceManagerService":
+        """Return the shared instance, skipping the constructor once it exists"""
+        return cls._instance or cls(bot)
+
+    def _setup(self, bot):
+        BaseLockHandler.__init__(self)
+        self.bot = bot
+        self.cache_manager = CacheManager()
+        self._write_queue: asyncio.Queue = asyncio.Queue()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._bg_tasks: Set[asyncio.Task] = set()
+
+    def _run_in_background(self, coro: Awaitable[Any]) -> None:
+        """Schedule a fire-and-forget coroutine, keeping a reference until it finishes"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
+
+    async def _submit_write(self, operation: Callable[[Any], Any]) -> Any:
+        """Queue a write operation for the group-commit writer and wait for its result"""
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.get_running_loop().create_task(self._drain_writes())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((operation, future))
+        return await future
+
+    @staticmethod
+    def _commit_batch(batch: List[Tuple[Callable[[Any], Any], asyncio.Future]]) -> List[Tuple]:
+        """Apply a batch of write operations in one transaction; runs in a worker thread"""
+        outcomes = []
+        with cache_pool.writer() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for operation, future in batch:
+                    # Savepoint per operation so one failure does not abort the batch
+                    conn.execute("SAVEPOINT balance_write")
+                    try:
+                        result = operation(conn)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO balance_write")
+                        conn.execute("RELEASE balance_write")
+                        outcomes.append((future, None, e))
+                    else:
+                        conn.execute("RELEASE balance_write")
+                        outcomes.append((future, result, None))
+                conn.commit()
+            except Exception as e:
+                logger.error("Error committing balance writes: %s", e)
+                conn.rollback()
+                outcomes = [(future, None, e) for _, future in batch]
+        return outcomes
 
+    async def _drain_writes(self):
+        """Commit queued write operations in batches so they share one fsync"""
+        while True:
+            batch = [await self._write_queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+
+            try:
+                # Futures are resolved back on the event loop, not in the worker thread
+                outcomes = await asyncio.to_thread(self._commit_batch, batch)
+                for future, result, error in outcomes:
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+
+    async def close(self):
+        """Flush queued writes, wait for pending cache updates and stop the writer task"""
+        if self._writer_task and not self._writer_task.done():
+            # Every queued write is committed and its caller resolved before cancelling
+            await self._write_queue.join()
+        if self._bg_tasks:
+            await asyncio.gather(*self._bg_tasks, return_exceptions=True)
+        if self._writer_task and not self._writer_task.done():
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+        self._writer_task = None
+        self._write_queue = asyncio.Queue()
+
+    def peek_growid(self, discord_id: str) -> Optional[str]:
+        """Return the GrowID only if it is already in memory cache (no I/O)"""
+        return self.cache_manager.peek(f"growid_{discord_id}")
+
+    @async_ttl_cache(time_to_live=3600, maxsize=20000)
     async def get_growid(self, discord_id: str) -> Optional[str]:
-        """Get GrowID for Discord user with proper locking and caching"""
+        """Get GrowID for Discord user with caching and coalesced loads"""
         cache_key = f"growid_{discord_id}"
         cached = await self.cache_manager.get(cache_key)
         if cached:
             return cached
-
-        lock = await self.acquire_lock(cache_key)
-        if not lock:
-            self.logger.warning(f"Failed to acquire lock for get_growid {discord_id}")
+        if self.cache_manager.peek(f"growid_miss_{discord_id}"):
             return None
 
+        return await self.single_flight(cache_key, lambda: self._load_growid(discord_id))
+
+    async def _load_growid(self, discord_id: str) -> Optional[str]:
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "SELECT growid FROM user_growid WHERE discord_id = ? COLLATE binary",
-                (str(discord_id),)
+            result = await asyncio.to_thread(
+                fetch_rows,
+                "SELECT growid FROM user_growid WHERE discord_id = ?",
+                (str(discord_id),),
+                True
             )
-            result = cursor.fetchone()
             
             if result:
                 growid = result['growid']
                 # Cache GrowID for 1 hour since it rarely changes
-                await self.cache_manager.set(cache_key, growid, expires_in=3600)
-                self.logger.info(f"Found GrowID for Discord ID {discord_id}: {growid}")
+                await self.cache_manager.set(f"growid_{discord_id}", growid, expires_in=3600)
+                logger.info("Found GrowID for Discord ID %s: %s", discord_id, growid)
                 return growid
+            # Unregistered users retry often; remember the miss briefly
+            await self.cache_manager.set(f"growid_miss_{discord_id}", True, expires_in=60)
             return None
 
         except Exception as e:
-            self.logger.error(f"Error getting GrowID: {e}")
+            logger.error("Error getting GrowID: %s", e)
             return None
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock(cache_key)
 
+    @async_ttl_cache(time_to_live=3600, maxsize=20000)
     async def get_user_by_growid(self, growid: str) -> Optional[str]:
-        """Get Discord ID by GrowID with caching"""
+        """Get Discord ID by GrowID with caching and coalesced loads"""
         cache_key = f"discord_id_{growid}"
         cached = await self.cache_manager.get(cache_key)
         if cached:
             return cached
 
+        return await self.single_flight(cache_key, lambda: self._load_user_by_growid(growid))
+
+    async def _load_user_by_growid(self, growid: str) -> Optional[str]:
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "SELECT discord_id FROM user_growid WHERE growid = ? COLLATE binary",
-                (growid,)
+            result = await asyncio.to_thread(
+                fetch_rows,
+                "SELECT discord_id FROM user_growid WHERE growid = ?",
+                (growid,),
+                True
             )
-            result = cursor.fetchone()
             
             if result:
                 discord_id = result['discord_id']
                 # Cache Discord ID for 1 hour
-                await self.cache_manager.set(cache_key, discord_id, expires_in=3600)
+                await self.cache_manager.set(f"discord_id_{growid}", discord_id, expires_in=3600)
                 return discord_id
             return None
 
         except Exception as e:
-            self.logger.error(f"Error getting Discord ID: {e}")
+            logger.error("Error getting Discord ID: %s", e)
             return None
-        finally:
-            if conn:
-                conn.close()
 
     async def register_user(self, discord_id: str, growid: str) -> bool:
         """Register user with proper locking"""
-        lock = await self.acquire_lock(f"register_{discord_id}")
+        lock = await self.acquire_lock(("register", discord_id))
         if not lock:
             raise TransactionError("System is busy, please try again later")
 
-        conn = None
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            # Check for existing GrowID (case-sensitive)
-            cursor.execute(
-                "SELECT growid FROM users WHERE growid = ? COLLATE binary",
-                (growid,)
-            )
-            existing = cursor.fetchone()
-            if existing and existing['growid'] != growid:
-                raise ValueError(f"GrowID already exists with different case: {existing['growid']}")
-            
-            # Begin transaction
-            conn.execute("BEGIN TRANSACTION")
-            
+        def register(conn):
             # Create user if not exists
-            cursor.execute(
-                "INSERT OR IGNORE INTO users (growid) VALUES (?)",
+            conn.execute(
+                "INSERT INTO users (growid) VALUES (?) ON CONFLICT(growid) DO NOTHING",
                 (growid,)
             )
             
             # Link Discord ID to GrowID
-            cursor.execute(
+            conn.execute(
                 "INSERT OR REPLACE INTO user_growid (discord_id, growid) VALUES (?, ?)",
                 (str(discord_id), growid)
             )
+
+        try:
+            # Commits both statements together, rolls back on error
+            await asyncio.to_thread(run_in_transaction, register)
             
-            conn.commit()
+            # Write through so the next button click needs no lookup
+            self.get_growid.cache_set(growid, discord_id)
+            self.get_user_by_growid.cache_set(discord_id, growid)
+            self.get_balance.cache_invalidate(growid)
             
-            # Update caches
+            # Memory-only sets never suspend, so apply them before returning to
+            # avoid serving stale entries; the DB-backed delete runs in background
             await self.cache_manager.set(f"growid_{discord_id}", growid, expires_in=3600)
             await self.cache_manager.set(f"discord_id_{growid}", discord_id, expires_in=3600)
-            await self.cache_manager.delete(f"balance_{growid}")
+            self._run_in_background(self.cache_manager.delete_many([
+                f"balance_{growid}", f"growid_miss_{discord_id}"
+            ]))
             
-            self.logger.info(f"Registered Discord user {discord_id} with GrowID {growid}")
+            logger.info("Registered Discord user %s with GrowID %s", discord_id, growid)
             return True
 
         except Exception as e:
-            self.logger.error(f"Error registering user: {e}")
-            if conn:
-                conn.rollback()
+            logger.error("Error registering user: %s", e)
             raise
         finally:
-            if conn:
-                conn.close()
-            self.release_lock(f"register_{discord_id}")
+            self.release_lock(("register", discord_id))
 
+    @async_ttl_cache(time_to_live=30, maxsize=20000)
     async def get_balance(self, growid: str) -> Optional[Balance]:
-        """Get user balance with proper locking and caching"""
+        """Get user balance with caching and coalesced loads"""
         cache_key = f"balance_{growid}"
         cached = await self.cache_manager.get(cache_key)
         if cached:
@@ -167,24 +255,15 @@ class BalanceManagerService(BaseLockHandler):
                 return Balance(cached['wl'], cached['dl'], cached['bgl'])
             return cached
 
-        lock = await self.acquire_lock(cache_key)
-        if not lock:
-            self.logger.warning(f"Failed to acquire lock for get_balance {growid}")
-            return None
+        return await self.single_flight(cache_key, lambda: self._load_balance(growid))
 
+    async def _load_balance(self, growid: str) -> Optional[Balance]:
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                """
+            result = await asyncio.to_thread(fetch_rows, """
                 SELECT balance_wl, balance_dl, balance_bgl 
                 FROM users 
-                WHERE growid = ? COLLATE binary
-                """,
-                (growid,)
-            )
-            result = cursor.fetchone()
+                WHERE growid = ?
+            """, (growid,), True)
             
             if result:
                 balance = Balance(
@@ -193,17 +272,13 @@ class BalanceManagerService(BaseLockHandler):
                     result['balance_bgl']
                 )
                 # Cache balance for 30 seconds since it changes frequently
-                await self.cache_manager.set(cache_key, balance, expires_in=30)
+                await self.cache_manager.set(f"balance_{growid}", balance, expires_in=30)
                 return balance
             return None
 
         except Exception as e:
-            self.logger.error(f"Error getting balance: {e}")
+            logger.error("Error getting balance: %s", e)
             return None
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock(cache_key)
 
     async def update_balance(
         self, 
@@ -215,55 +290,30 @@ class BalanceManagerService(BaseLockHandler):
         transaction_type: str = ""
     ) -> Optional[Balance]:
         """Update balance with proper locking and validation"""
-        lock = await self.acquire_lock(f"balance_update_{growid}")
+        lock = await self.acquire_lock(("balance_update", growid))
         if not lock:
             raise TransactionError("System is busy, please try again later")
 
-        conn = None
-        try:
-            conn = get_connection()
+        def apply_update(conn) -> Tuple[Balance, Balance]:
             cursor = conn.cursor()
-            
-            # Get current balance with retry
-            for attempt in range(3):
-                try:
-                    cursor.execute(
-                        """
-                        SELECT balance_wl, balance_dl, balance_bgl 
-                        FROM users 
-                        WHERE growid = ? COLLATE binary
-                        """,
-                        (growid,)
-                    )
-                    current = cursor.fetchone()
-                    if current:
-                        break
-                    if attempt == 2:  # Last attempt
-                        raise TransactionError(f"User {growid} not found")
-                    await asyncio.sleep(0.1)  # Short delay before retry
-                except Exception as e:
-                    if attempt == 2:  # Last attempt
-                        raise
-                    await asyncio.sleep(0.1)
-            
-            old_balance = Balance(
-                current['balance_wl'],
-                current['balance_dl'],
-                current['balance_bgl']
+            cursor.execute(
+                """
+                SELECT balance_wl, balance_dl, balance_bgl 
+                FROM users 
+                WHERE growid = ?
+                """,
+                (growid,)
             )
-            
-            # Calculate new balance with validation
-            new_wl = max(0, current['balance_wl'] + wl)
-            new_dl = max(0, current['balance_dl'] + dl)
-            new_bgl = max(0, current['balance_bgl'] + bgl)
-            
-            # Additional validation
-            if wl < 0 and abs(wl) > current['balance_wl']:
-                raise TransactionError("Insufficient WL balance")
-            if dl < 0 and abs(dl) > current['balance_dl']:
-                raise TransactionError("Insufficient DL balance")
-            if bgl < 0 and abs(bgl) > current['balance_bgl']:
-                raise TransactionError("Insufficient BGL balance")
+            current = cursor.fetchone()
+            if not current:
+                raise TransactionError(f"User {growid} not found")
+
+            cwl, cdl, cbgl = current
+            new_wl, new_dl, new_bgl = cwl + wl, cdl + dl, cbgl + bgl
+            if new_wl < 0 or new_dl < 0 or new_bgl < 0:
+                raise TransactionError(
+                    f"Insufficient balance: WL={new_wl} DL={new_dl} BGL={new_bgl}"
+                )
             
             # Update balance
             cursor.execute(
@@ -271,59 +321,52 @@ class BalanceManagerService(BaseLockHandler):
                 UPDATE users 
                 SET balance_wl = ?, balance_dl = ?, balance_bgl = ?,
                     updated_at = CURRENT_TIMESTAMP
-                WHERE growid = ? COLLATE binary
+                WHERE growid = ?
                 """,
                 (new_wl, new_dl, new_bgl, growid)
             )
             
             new_balance = Balance(new_wl, new_dl, new_bgl)
             
-            # Record transaction with retry
-            for attempt in range(3):
-                try:
-                    cursor.execute(
-                        """
-                        INSERT INTO transactions 
-                        (growid, type, details, old_balance, new_balance, created_at) 
-                        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                        """,
-                        (
-                            growid,
-                            transaction_type,
-                            details,
-                            old_balance.format(),
-                            new_balance.format()
-                        )
-                    )
-                    break
-                except Exception as e:
-                    if attempt == 2:  # Last attempt
-                        raise
-                    await asyncio.sleep(0.1)
-            
-            conn.commit()
+            # Record transaction; balances are formatted when history is read
+            cursor.execute(
+                """
+                INSERT INTO transactions 
+                (growid, type, details, old_wl, old_dl, old_bgl,
+                 new_wl, new_dl, new_bgl, created_at) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                """,
+                (
+                    growid,
+                    transaction_type,
+                    details,
+                    cwl, cdl, cbgl,
+                    new_wl, new_dl, new_bgl
+                )
+            )
+            return Balance(cwl, cdl, cbgl), new_balance
+
+        try:
+            # Committed together with other queued writes by the writer task
+            old_balance, new_balance = await self._submit_write(apply_update)
+            self.get_balance.cache_invalidate(growid)
             
-            # Update cache with new balance
+            # Memory-only set never suspends; deferring it would let get_balance
+            # serve the pre-update value from the cache manager
             await self.cache_manager.set(f"balance_{growid}", new_balance, expires_in=30)
             
             # Also invalidate any transaction history caches
-            await self.cache_manager.delete(f"trx_history_{growid}")
+            self._run_in_background(self.cache_manager.delete(f"trx_history_{growid}"))
             
-            self.logger.info(
-                f"Updated balance for {growid}: "
-                f"{old_balance.format()} -> {new_balance.format()}"
-            )
+            # Balance.__str__ formats lazily, only if the record is emitted
+            logger.info("Updated balance for %s: %s -> %s", growid, old_balance, new_balance)
             return new_balance
 
         except Exception as e:
-            self.logger.error(f"Error updating balance: {e}")
-            if conn:
-                conn.rollback()
+            logger.error("Error updating balance: %s", e)
             raise
         finally:
-            if conn:
-                conn.close()
-            self.release_lock(f"balance_update_{growid}")
+            self.release_lock(("balance_update", growid))
 
     async def get_transaction_history(self, growid: str, limit: int = 10) -> list:
         """Get transaction history with caching"""
@@ -333,17 +376,26 @@ class BalanceManagerService(BaseLockHandler):
             return cached[:limit]  # Return only requested number of items
 
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT * FROM transactions 
-                WHERE growid = ? COLLATE binary
+            # created_at_ts is epoch seconds so callers don't have to parse strings
+            rows = await asyncio.to_thread(fetch_rows, """
+                SELECT *, CAST(strftime('%s', created_at) AS INTEGER) AS created_at_ts
+                FROM transactions 
+                WHERE growid = ?
                 ORDER BY created_at DESC
                 LIMIT ?
             """, (growid, limit))
             
-            transactions = [dict(row) for row in cursor.fetchall()]
+            transactions = [dict(row) for row in rows]
+            for trx in transactions:
+                # Rows written by update_balance store balances as integers
+                if trx['old_balance'] is None and trx['old_wl'] is not None:
+                    trx['old_balance'] = Balance(
+                        trx['old_wl'], trx['old_dl'], trx['old_bgl']
+                    ).format()
+                if trx['new_balance'] is None and trx['new_wl'] is not None:
+                    trx['new_balance'] = Balance(
+                        trx['new_wl'], trx['new_dl'], trx['new_bgl']
+                    ).format()
             
             # Cache full history for 1 minute
             await self.cache_manager.set(cache_key, transactions, expires_in=60)
@@ -351,23 +403,21 @@ class BalanceManagerService(BaseLockHandler):
             return transactions
 
         except Exception as e:
-            self.logger.error(f"Error getting transaction history: {e}")
+            logger.error("Error getting transaction history: %s", e)
             return []
-        finally:
-            if conn:
-                conn.close()
 
 class BalanceManagerCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.balance_service = BalanceManagerService(bot)
+        self.balance_service = BalanceManagerService.get(bot)
         self.logger = logging.getLogger("BalanceManagerCog")
 
     async def cog_load(self):
         self.logger.info("BalanceManagerCog loading...")
 
     async def cog_unload(self):
-        await self.balance_service.cleanup()
+        await self.balance_service.close()
+        self.balance_service.cleanup()
         self.logger.info("BalanceManagerCog unloaded")
 
 async def setup(bot):
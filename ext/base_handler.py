@@ -1,35 +1,57 @@
 import asyncio
 from asyncio import Lock
 import logging
-from typing import Optional, Dict
-from discord.ext import commands
+from typing import Any, Awaitable, Callable, Hashable, Optional, Dict
 import discord
 
+# Jumlah shard lock per handler (harus pangkat dua, dipakai sebagai mask)
+LOCK_SHARDS = 64
+
 class BaseLockHandler:
     """Handler untuk sistem locking"""
     
     def __init__(self):
-        self._locks: Dict[str, Lock] = {}
-        self._response_locks: Dict[str, Lock] = {}
+        # Lock dibuat sekali di awal; key dipetakan ke shard lewat hash
+        self._lock_shards = [Lock() for _ in range(LOCK_SHARDS)]
+        self._response_locks: Dict[int, Lock] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
         self.logger = logging.getLogger(self.__class__.__name__)
         
-    async def acquire_lock(self, key: str, timeout: float = 10.0) -> Optional[Lock]:
+    @staticmethod
+    async def _acquire_fast(lock: Lock, timeout: float) -> None:
+        """
+        Acquire lock, tanpa timer jika lock sedang bebas
+        
+        Lock yang tidak terkunci dan tanpa antrean langsung didapat tanpa
+        suspend, jadi wait_for (beserta timer-nya) hanya dipakai saat ada
+        kontensi.
         """
-        Dapatkan atau buat lock untuk key tertentu
+        if not lock.locked() and not getattr(lock, '_waiters', None):
+            await lock.acquire()
+        else:
+            await asyncio.wait_for(lock.acquire(), timeout=timeout)
+
+    def _shard_of(self, key: Hashable) -> Lock:
+        return self._lock_shards[hash(key) & (LOCK_SHARDS - 1)]
+
+    async def acquire_lock(self, key: Hashable, timeout: float = 10.0) -> Optional[Lock]:
+        """
+        Dapatkan lock shard untuk key tertentu
+        
+        Key yang berbeda bisa berbagi shard, jadi jangan memegang dua
+        lock dari handler yang sama sekaligus.
         
         Args:
-            key: Unique identifier untuk lock
+            key: Identifier lock, mis. tuple ("deposit", user_id)
             timeout: Waktu maksimum menunggu lock dalam detik
             
         Returns:
             Lock object jika berhasil, None jika gagal
         """
-        if key not in self._locks:
-            self._locks[key] = Lock()
-            
+        lock = self._shard_of(key)
         try:
-            await asyncio.wait_for(self._locks[key].acquire(), timeout=timeout)
-            return self._locks[key]
+            await self._acquire_fast(lock, timeout)
+            return lock
         except asyncio.TimeoutError:
             self.logger.error(f"Failed to acquire lock for {key} within {timeout} seconds")
             return None
@@ -37,6 +59,55 @@ class BaseLockHandler:
             self.logger.error(f"Error acquiring lock for {key}: {e}")
             return None
 
+    async def single_flight(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Gabungkan pemanggilan bersamaan untuk key yang sama menjadi satu eksekusi
+
+        Pemanggil pertama menjalankan loader, pemanggil lain menunggu Future
+        yang sama sehingga tidak ada query duplikat saat cache kosong.
+
+        Args:
+            key: Unique identifier untuk operasi
+            loader: Coroutine function tanpa argumen yang mengambil data
+
+        Returns:
+            Hasil dari loader
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Shield agar pembatalan satu waiter tidak membatalkan Future bersama
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Tandai sudah diambil jika tidak ada waiter
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _key_of(ctx_or_interaction) -> int:
+        """
+        Key untuk response lock tanpa pengecekan isinstance
+        
+        Interaction punya `id`, Context memakai `message.id`,
+        selain itu fallback ke object id.
+        """
+        key = getattr(ctx_or_interaction, 'id', None)
+        if key is None:
+            key = getattr(getattr(ctx_or_interaction, 'message', None), 'id', None)
+        return key if key is not None else id(ctx_or_interaction)
+
     async def acquire_response_lock(self, ctx_or_interaction, timeout: float = 5.0) -> bool:
         """
         Acquire lock untuk response context/interaction
@@ -49,42 +120,29 @@ class BaseLockHandler:
             True jika berhasil acquire lock, False jika gagal
         """
         try:
-            # Gunakan message.id untuk Context dan interaction.id untuk Interaction
-            if isinstance(ctx_or_interaction, commands.Context):
-                key = str(ctx_or_interaction.message.id)
-            elif isinstance(ctx_or_interaction, discord.Interaction):
-                key = str(ctx_or_interaction.id)
-            else:
-                key = str(id(ctx_or_interaction))  # Fallback menggunakan object id
-                
+            key = self._key_of(ctx_or_interaction)
             if key not in self._response_locks:
                 self._response_locks[key] = Lock()
                 
-            await asyncio.wait_for(self._response_locks[key].acquire(), timeout=timeout)
+            await self._acquire_fast(self._response_locks[key], timeout)
             return True
         except Exception as e:
             self.logger.error(f"Error acquiring response lock: {e}")
             return False
 
-    def release_lock(self, key: str):
+    def release_lock(self, key: Hashable):
         """Release lock untuk key tertentu"""
-        if key in self._locks and self._locks[key].locked():
+        lock = self._shard_of(key)
+        if lock.locked():
             try:
-                self._locks[key].release()
+                lock.release()
             except RuntimeError:
                 self.logger.warning(f"Attempted to release an unlocked lock for {key}")
 
     def release_response_lock(self, ctx_or_interaction):
         """Release response lock untuk context/interaction"""
         try:
-            # Gunakan message.id untuk Context dan interaction.id untuk Interaction
-            if isinstance(ctx_or_interaction, commands.Context):
-                key = str(ctx_or_interaction.message.id)
-            elif isinstance(ctx_or_interaction, discord.Interaction):
-                key = str(ctx_or_interaction.id)
-            else:
-                key = str(id(ctx_or_interaction))  # Fallback menggunakan object id
-                
+            key = self._key_of(ctx_or_interaction)
             if key in self._response_locks and self._response_locks[key].locked():
                 try:
                     self._response_locks[key].release()
@@ -95,8 +153,8 @@ class BaseLockHandler:
 
     def cleanup(self):
         """Bersihkan semua resources"""
-        self._locks.clear()
         self._response_locks.clear()
+        self._inflight.clear()
 
     async def __aenter__(self):
         """Support untuk async context manager"""
@@ -1,21 +1,54 @@
 import logging
 import time
 import json
-from typing import Optional, Any, Dict
-from datetime import datetime, timedelta
+from typing import Optional, Any, Awaitable, Callable, Dict, List, Tuple
 from sqlite3 import Connection, Error as SQLiteError
-from database import get_connection
+from database import cache_pool
 import asyncio
+from collections import OrderedDict
 from functools import wraps
+from itertools import islice
+from .constants import ADMIN_BULK_UPDATE_CHUNK
 
 logger = logging.getLogger(__name__)
 
+# orjson jauh lebih cepat dari json bawaan; fallback jika belum terpasang
+try:
+    import orjson
+
+    def _dumps(value: Any) -> str:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    _dumps = json.dumps
+    _loads = json.loads
+
+# Count-min sketch untuk admission TinyLFU (4 baris x 16384 counter 4-bit)
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 1 << 14
+_SKETCH_MASK = SKETCH_WIDTH - 1
+_HALVE = bytes(i >> 1 for i in range(256))
+
+# Penanda cache miss, beda dengan nilai None yang memang tersimpan
+_MISS = object()
+
+# Jeda write-behind sebelum set permanent ditulis sekaligus ke database
+WRITE_BEHIND_DELAY = 0.1
+
+# Jumlah baris expired yang dihapus per transaksi saat cleanup
+CLEANUP_BATCH_SIZE = ADMIN_BULK_UPDATE_CHUNK * 100
+
 class CacheManager:
     """
     Enhanced Cache Manager dengan Database Integration
+    
+    Query SQLite dijalankan lewat asyncio.to_thread agar event loop tidak
+    ikut terblokir oleh disk I/O. Read memakai connection pool secara
+    paralel, sedangkan semua write diantrikan ke satu writer task dengan
+    connection tersendiri.
     """
     _instance = None
-    _lock = asyncio.Lock()
     
     def __new__(cls):
         if cls._instance is None:
@@ -24,71 +57,270 @@ class CacheManager:
     
     def __init__(self):
         if not hasattr(self, 'initialized'):
-            self.memory_cache: Dict[str, Dict] = {}
+            # LRU: entry paling lama tidak dipakai ada di depan
+            self.memory_cache: "OrderedDict[str, Dict]" = OrderedDict()
+            self.max_items = 10000
+            self._sketch = bytearray(SKETCH_DEPTH * SKETCH_WIDTH)
+            self._sketch_ops = 0
             self.logger = logging.getLogger('CacheManager')
+            self._write_queue: Optional[asyncio.Queue] = None
+            self._writer_task: Optional[asyncio.Task] = None
+            # Buffer write-behind: key -> (value, serialized, expires_at)
+            self._pending_sets: Dict[str, Tuple[Any, Any, float]] = {}
+            self._flush_task: Optional[asyncio.Task] = None
             self.initialized = True
+
+    # Operasi database (sync, dijalankan di thread pool)
+
+    def _db_get(self, key: str) -> Optional[Tuple[str, int]]:
+        with cache_pool.acquire() as conn:
+            return conn.execute(
+                "SELECT value, expires_at_i FROM cache_table WHERE key = ?",
+                (key,)
+            ).fetchone()
+
+    @staticmethod
+    def _db_set_many(conn: Connection, rows: List[Tuple[str, Any, int]]) -> None:
+        conn.executemany("""
+            INSERT OR REPLACE INTO cache_table (key, value, expires_at, expires_at_i)
+            VALUES (?1, ?2, datetime(?3, 'unixepoch'), ?3)
+        """, rows)
+
+    @staticmethod
+    def _db_delete(conn: Connection, key: str) -> None:
+        conn.execute("DELETE FROM cache_table WHERE key = ?", (key,))
+
+    @staticmethod
+    def _db_delete_many(conn: Connection, keys: List[str]) -> None:
+        conn.executemany("DELETE FROM cache_table WHERE key = ?", [(key,) for key in keys])
+
+    @staticmethod
+    def _db_clear(conn: Connection) -> None:
+        conn.execute("DELETE FROM cache_table")
+
+    @staticmethod
+    def _db_cleanup(conn: Connection, before: int, limit: int) -> int:
+        return conn.execute("""
+            DELETE FROM cache_table WHERE rowid IN (
+                SELECT rowid FROM cache_table WHERE expires_at_i < ? LIMIT ?
+            )
+        """, (before, limit)).rowcount
+
+    def _apply_writes(self, batch: List[Tuple]) -> List[Tuple[Any, Optional[Exception]]]:
+        """Jalankan satu batch write dalam satu transaksi lewat writer pool"""
+        outcomes: List[Tuple[Any, Optional[Exception]]] = []
+        with cache_pool.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for func, args, _ in batch:
+                conn.execute("SAVEPOINT cache_write")
+                try:
+                    outcomes.append((func(conn, *args), None))
+                except SQLiteError as e:
+                    conn.execute("ROLLBACK TO cache_write")
+                    outcomes.append((None, e))
+                finally:
+                    conn.execute("RELEASE cache_write")
+            conn.commit()
+        return outcomes
+
+    async def _drain_writes(self) -> None:
+        """Writer task: ambil semua write yang antre lalu commit sekaligus"""
+        queue = self._write_queue
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+
+            try:
+                outcomes = await asyncio.to_thread(self._apply_writes, batch)
+            except Exception as e:
+                self.logger.error(f"Cache writer failed to commit batch: {e}")
+                outcomes = [(None, e)] * len(batch)
+
+            for (_, _, future), (result, error) in zip(batch, outcomes):
+                if not future.done():
+                    if error is None:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(error)
+                queue.task_done()
+
+    async def _submit_write(self, func: Callable[..., Any], *args) -> Any:
+        """Antrikan write ke writer task dan tunggu hasilnya setelah di-commit"""
+        if self._write_queue is None:
+            self._write_queue = asyncio.Queue()
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._drain_writes())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((func, args, future))
+        return await future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(WRITE_BEHIND_DELAY)
+        await self.flush()
+
+    async def flush(self) -> bool:
+        """
+        Tulis semua set permanent di buffer write-behind ke database
+        
+        Dipakai oleh writer terjadwal, atau dipanggil langsung jika caller
+        butuh data sudah tersimpan saat method ini selesai.
+        """
+        if not self._pending_sets:
+            return True
+
+        rows = [
+            (key, serialized, int(expires_at))
+            for key, (_, serialized, expires_at) in self._pending_sets.items()
+        ]
+        self._pending_sets = {}
+        try:
+            await self._submit_write(self._db_set_many, rows)
+            self.logger.debug(f"Cache flushed {len(rows)} permanent entries")
+            return True
+        except SQLiteError as e:
+            self.logger.error(f"Database error in flush: {e}")
+            return False
+
+    async def close(self) -> None:
+        """Tulis buffer dan write yang tersisa lalu hentikan writer task"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+        await self.flush()
+
+        if self._write_queue is not None and self._writer_task is not None:
+            if not self._writer_task.done():
+                await self._write_queue.join()
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+        self._writer_task = None
+        self._write_queue = None
+
+    def _db_stats(self, now: int) -> Tuple[int, int]:
+        with cache_pool.acquire() as conn:
+            db_cache_size, db_cache_valid = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(expires_at_i > ?), 0) FROM cache_table",
+                (now,)
+            ).fetchone()
+            return db_cache_size, db_cache_valid
     
     async def get(self, key: str, default: Any = None) -> Optional[Any]:
         """
         Ambil data dari cache (memory atau database)
         """
         try:
-            # Cek memory cache dulu
-            if key in self.memory_cache:
-                cache_data = self.memory_cache[key]
-                if self._is_valid(cache_data):
-                    self.logger.debug(f"Cache hit (memory): {key}")
-                    return cache_data['value']
-                else:
-                    # Hapus cache yang expired
-                    del self.memory_cache[key]
+            self._record_access(key)
+
+            value = self._get_local(key)
+            if value is not _MISS:
+                return value
             
-            # Jika tidak ada di memory, cek database
-            async with self._lock:
-                conn = get_connection()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "SELECT value, expires_at FROM cache_table WHERE key = ?",
-                        (key,)
-                    )
-                    result = cursor.fetchone()
-                    
-                    if result:
-                        value, expires_at = result
-                        expires_at = datetime.fromisoformat(expires_at)
-                        
-                        if expires_at > datetime.utcnow():
-                            # Cache masih valid
-                            try:
-                                decoded_value = json.loads(value)
-                                # Simpan ke memory cache
-                                self.memory_cache[key] = {
-                                    'value': decoded_value,
-                                    'expires_at': expires_at
-                                }
-                                self.logger.debug(f"Cache hit (database): {key}")
-                                return decoded_value
-                            except json.JSONDecodeError:
-                                self.logger.warning(f"Failed to decode cache value for key: {key}")
-                                return value
-                        else:
-                            # Hapus cache yang expired
-                            cursor.execute("DELETE FROM cache_table WHERE key = ?", (key,))
-                            conn.commit()
-                    
-                    return default
-                    
-                except SQLiteError as e:
-                    self.logger.error(f"Database error in get: {e}")
-                    return default
-                finally:
-                    conn.close()
+            # Jika tidak ada di memory, cek database (read tidak perlu lock)
+            try:
+                result = await asyncio.to_thread(self._db_get, key)
+            except SQLiteError as e:
+                self.logger.error(f"Database error in get: {e}")
+                return default
+
+            if not result:
+                return default
+
+            value, expires_at_i = result
+            
+            if expires_at_i > time.time():
+                # Cache masih valid
+                return self._decode_row(key, value, expires_at_i)
+
+            # Hapus cache yang expired
+            try:
+                await self._submit_write(self._db_delete, key)
+            except SQLiteError as e:
+                self.logger.error(f"Database error in get: {e}")
+            
+            return default
         
         except Exception as e:
             self.logger.error(f"Error in get: {e}")
             return default
     
+    def _get_local(self, key: str) -> Any:
+        """Cari di memory cache dan buffer write-behind; _MISS jika tidak ada"""
+        cache_data = self.memory_cache.get(key)
+        if cache_data is not None:
+            if self._is_valid(cache_data):
+                self.memory_cache.move_to_end(key)
+                self.logger.debug(f"Cache hit (memory): {key}")
+                return cache_data['value']
+            # Hapus cache yang expired
+            self.memory_cache.pop(key, None)
+
+        # Set permanent yang belum di-flush
+        pending = self._pending_sets.get(key)
+        if pending is not None and pending[2] > time.time():
+            return pending[0]
+        return _MISS
+
+    def _decode_row(self, key: str, value: Any, expires_at_i: int) -> Any:
+        """Decode nilai dari database dan promosikan ke memory cache"""
+        if not isinstance(value, str):
+            return value
+        try:
+            decoded_value = _loads(value)
+            # Promosikan ke memory cache beserta bentuk serialnya
+            self._admit(key, decoded_value, expires_at_i, value)
+            self.logger.debug(f"Cache hit (database): {key}")
+            return decoded_value
+        except ValueError:
+            self.logger.warning(f"Failed to decode cache value for key: {key}")
+            return value
+
+    def peek(self, key: str, default: Any = None) -> Any:
+        """
+        Ambil data dari memory cache saja, tanpa I/O
+
+        Untuk jalur yang harus cepat (mis. sebelum merespons interaction);
+        miss di sini belum berarti data tidak ada di database.
+        """
+        cache_data = self.memory_cache.get(key)
+        if cache_data is not None and self._is_valid(cache_data):
+            return cache_data['value']
+        return default
+
+    def set_nx(self, key: str, value: Any, expires_in: float) -> bool:
+        """
+        Simpan ke memory cache hanya jika key belum ada atau sudah kadaluarsa
+        
+        Cek dan simpan terjadi tanpa await, jadi atomik terhadap coroutine lain.
+        Entry tidak melalui admission TinyLFU (yang bisa menolak key baru),
+        saat penuh entry terlama langsung dibuang. Return True jika tersimpan.
+        """
+        now = time.time()
+        cache_data = self.memory_cache.get(key)
+        if cache_data is not None and cache_data['expires_at'] > now:
+            return False
+
+        self._record_access(key)
+        if cache_data is None and len(self.memory_cache) >= self.max_items:
+            self.memory_cache.popitem(last=False)
+        self.memory_cache[key] = {
+            'value': value,
+            'expires_at': now + expires_in
+        }
+        self.memory_cache.move_to_end(key)
+        return True
+
+    def ttl(self, key: str) -> float:
+        """Sisa waktu (detik) entry di memory cache; 0 jika tidak ada atau kadaluarsa"""
+        cache_data = self.memory_cache.get(key)
+        if cache_data is None:
+            return 0.0
+        return max(cache_data['expires_at'] - time.time(), 0.0)
+
     async def set(self, 
                   key: str, 
                   value: Any, 
@@ -104,39 +336,33 @@ class CacheManager:
             permanent: Jika True, simpan ke database (default False)
         """
         try:
-            expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
+            # Epoch detik (float) agar cek expiry cukup satu perbandingan angka
+            expires_at = time.time() + expires_in
             
-            # Simpan ke memory cache
-            self.memory_cache[key] = {
-                'value': value,
-                'expires_at': expires_at
-            }
+            serialized = None
+            if permanent:
+                # Tipe primitif disimpan apa adanya; objek yang sama dengan
+                # isi cache memakai ulang hasil serialisasi sebelumnya
+                if isinstance(value, (str, int, float, bool)):
+                    serialized = value
+                else:
+                    current = self.memory_cache.get(key)
+                    if current is not None and current['value'] is value:
+                        serialized = current.get('serialized')
+                    if serialized is None:
+                        serialized = _dumps(value)
+
+            self._record_access(key)
+            self._admit(key, value, expires_at, serialized)
             
-            # Jika permanent, simpan juga ke database
+            # Jika permanent, antrikan ke buffer write-behind
             if permanent:
-                async with self._lock:
-                    conn = get_connection()
-                    try:
-                        cursor = conn.cursor()
-                        
-                        # Konversi value ke JSON jika perlu
-                        if not isinstance(value, (str, int, float, bool)):
-                            value = json.dumps(value)
-                            
-                        cursor.execute("""
-                            INSERT OR REPLACE INTO cache_table (key, value, expires_at)
-                            VALUES (?, ?, ?)
-                        """, (key, value, expires_at.isoformat()))
-                        
-                        conn.commit()
-                        self.logger.debug(f"Cache set (permanent): {key}")
-                        return True
-                        
-                    except SQLiteError as e:
-                        self.logger.error(f"Database error in set: {e}")
-                        return False
-                    finally:
-                        conn.close()
+
+                self._pending_sets[key] = (value, serialized, expires_at)
+                if self._flush_task is None or self._flush_task.done():
+                    self._flush_task = asyncio.create_task(self._flush_later())
+                self.logger.debug(f"Cache set (permanent, queued): {key}")
+                return True
             
             self.logger.debug(f"Cache set (memory): {key}")
             return True
@@ -144,51 +370,77 @@ class CacheManager:
         except Exception as e:
             self.logger.error(f"Error in set: {e}")
             return False
-    
+
+    async def get_or_set(self,
+                         key: str,
+                         loader: Callable[[], Awaitable[Any]],
+                         expires_in: Optional[int] = 3600,
+                         permanent: bool = False) -> Any:
+        """
+        Ambil dari cache, atau jalankan loader dan simpan hasilnya
+
+        Hasil kosong (mis. list kosong) tetap dianggap hit. Exception dari
+        loader diteruskan ke pemanggil dan tidak disimpan ke cache.
+        """
+        value = await self.get(key, _MISS)
+        if value is not _MISS:
+            return value
+
+        value = await loader()
+        await self.set(key, value, expires_in=expires_in, permanent=permanent)
+        return value
+
     async def delete(self, key: str) -> bool:
         """Hapus item dari cache"""
         try:
-            # Hapus dari memory cache
-            if key in self.memory_cache:
-                del self.memory_cache[key]
+            # Hapus dari memory cache dan buffer write-behind
+            self.memory_cache.pop(key, None)
+            self._pending_sets.pop(key, None)
             
             # Hapus dari database
-            async with self._lock:
-                conn = get_connection()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM cache_table WHERE key = ?", (key,))
-                    conn.commit()
-                    return True
-                except SQLiteError as e:
-                    self.logger.error(f"Database error in delete: {e}")
-                    return False
-                finally:
-                    conn.close()
+            try:
+                await self._submit_write(self._db_delete, key)
+                return True
+            except SQLiteError as e:
+                self.logger.error(f"Database error in delete: {e}")
+                return False
                     
         except Exception as e:
             self.logger.error(f"Error in delete: {e}")
             return False
     
+    async def delete_many(self, keys: List[str]) -> bool:
+        """Hapus beberapa item sekaligus dalam satu write ke database"""
+        try:
+            for key in keys:
+                self.memory_cache.pop(key, None)
+                self._pending_sets.pop(key, None)
+
+            try:
+                await self._submit_write(self._db_delete_many, list(keys))
+                return True
+            except SQLiteError as e:
+                self.logger.error(f"Database error in delete_many: {e}")
+                return False
+
+        except Exception as e:
+            self.logger.error(f"Error in delete_many: {e}")
+            return False
+
     async def clear(self) -> bool:
         """Bersihkan semua cache"""
         try:
-            # Bersihkan memory cache
+            # Bersihkan memory cache dan buffer write-behind
             self.memory_cache.clear()
+            self._pending_sets.clear()
             
             # Bersihkan database cache
-            async with self._lock:
-                conn = get_connection()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM cache_table")
-                    conn.commit()
-                    return True
-                except SQLiteError as e:
-                    self.logger.error(f"Database error in clear: {e}")
-                    return False
-                finally:
-                    conn.close()
+            try:
+                await self._submit_write(self._db_clear)
+                return True
+            except SQLiteError as e:
+                self.logger.error(f"Database error in clear: {e}")
+                return False
                     
         except Exception as e:
             self.logger.error(f"Error in clear: {e}")
@@ -198,72 +450,111 @@ class CacheManager:
         """Bersihkan cache yang expired"""
         try:
             # Bersihkan memory cache
-            current_time = datetime.utcnow()
-            expired_keys = [
-                key for key, data in self.memory_cache.items()
-                if data['expires_at'] <= current_time
-            ]
-            for key in expired_keys:
-                del self.memory_cache[key]
+            # Bangun ulang sekali jalan, urutan LRU tetap terjaga
+            current_time = time.time()
+            self.memory_cache = OrderedDict(
+                (key, data) for key, data in self.memory_cache.items()
+                if data['expires_at'] > current_time
+            )
             
-            # Bersihkan database cache
-            async with self._lock:
-                conn = get_connection()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "DELETE FROM cache_table WHERE expires_at < ?",
-                        (current_time.isoformat(),)
+            # Bersihkan database cache per batch agar writer tidak tertahan lama
+            now = int(current_time)
+            try:
+                while True:
+                    deleted = await self._submit_write(
+                        self._db_cleanup, now, CLEANUP_BATCH_SIZE
                     )
-                    conn.commit()
-                except SQLiteError as e:
-                    self.logger.error(f"Database error in cleanup: {e}")
-                finally:
-                    conn.close()
+                    if deleted < CLEANUP_BATCH_SIZE:
+                        break
+                    await asyncio.sleep(0)
+            except SQLiteError as e:
+                self.logger.error(f"Database error in cleanup: {e}")
                     
         except Exception as e:
             self.logger.error(f"Error in cleanup: {e}")
     
+    def _record_access(self, key: str) -> None:
+        """Tambah frekuensi key di sketch, dengan aging berkala"""
+        h = hash(key)
+        sketch = self._sketch
+        for row in range(SKETCH_DEPTH):
+            idx = row * SKETCH_WIDTH + ((h >> (row * 16)) & _SKETCH_MASK)
+            if sketch[idx] < 15:
+                sketch[idx] += 1
+
+        self._sketch_ops += 1
+        if self._sketch_ops >= self.max_items * 10:
+            # Halving agar frekuensi lama perlahan dilupakan
+            self._sketch = bytearray(sketch.translate(_HALVE))
+            self._sketch_ops = 0
+
+    def _frequency(self, key: str) -> int:
+        """Estimasi frekuensi akses key dari sketch"""
+        h = hash(key)
+        return min(
+            self._sketch[row * SKETCH_WIDTH + ((h >> (row * 16)) & _SKETCH_MASK)]
+            for row in range(SKETCH_DEPTH)
+        )
+
+    def _make_room(self, key: str) -> bool:
+        """
+        Admission TinyLFU untuk key baru saat memory cache penuh
+        
+        Dari dua entry terlama di LRU dipilih yang paling jarang diakses
+        sebagai korban; key baru hanya masuk jika lebih sering diakses.
+        """
+        if len(self.memory_cache) < self.max_items:
+            return True
+
+        victim = min(islice(self.memory_cache, 2), key=self._frequency)
+        if self._frequency(key) <= self._frequency(victim):
+            return False
+
+        del self.memory_cache[victim]
+        return True
+
+    def _admit(self, key: str, value: Any, expires_at: float, serialized: Any = None) -> None:
+        """Masukkan entry ke memory cache sebagai yang terbaru jika lolos admission"""
+        if key in self.memory_cache or self._make_room(key):
+            entry = {
+                'value': value,
+                'expires_at': expires_at
+            }
+            if serialized is not None:
+                entry['serialized'] = serialized
+            self.memory_cache[key] = entry
+            self.memory_cache.move_to_end(key)
+
     def _is_valid(self, cache_data: Dict) -> bool:
         """Cek apakah cache masih valid"""
-        return cache_data['expires_at'] > datetime.utcnow()
+        return cache_data['expires_at'] > time.time()
 
     async def get_stats(self) -> Dict:
         """Dapatkan statistik cache"""
         try:
+            now = time.time()
             memory_cache_size = len(self.memory_cache)
             memory_cache_valid = sum(
                 1 for data in self.memory_cache.values()
-                if self._is_valid(data)
+                if data['expires_at'] > now
             )
             
-            async with self._lock:
-                conn = get_connection()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT COUNT(*) FROM cache_table")
-                    db_cache_size = cursor.fetchone()[0]
-                    
-                    cursor.execute(
-                        "SELECT COUNT(*) FROM cache_table WHERE expires_at > ?",
-                        (datetime.utcnow().isoformat(),)
-                    )
-                    db_cache_valid = cursor.fetchone()[0]
-                    
-                    return {
-                        'memory_cache': {
-                            'total': memory_cache_size,
-                            'valid': memory_cache_valid,
-                            'expired': memory_cache_size - memory_cache_valid
-                        },
-                        'db_cache': {
-                            'total': db_cache_size,
-                            'valid': db_cache_valid,
-                            'expired': db_cache_size - db_cache_valid
-                        }
-                    }
-                finally:
-                    conn.close()
+            db_cache_size, db_cache_valid = await asyncio.to_thread(
+                self._db_stats, int(now)
+            )
+            
+            return {
+                'memory_cache': {
+                    'total': memory_cache_size,
+                    'valid': memory_cache_valid,
+                    'expired': memory_cache_size - memory_cache_valid
+                },
+                'db_cache': {
+                    'total': db_cache_size,
+                    'valid': db_cache_valid,
+                    'expired': db_cache_size - db_cache_valid
+                }
+            }
                     
         except Exception as e:
             self.logger.error(f"Error getting cache stats: {e}")
@@ -279,22 +570,95 @@ def cached(expires_in: int = 3600, permanent: bool = False):
         permanent: Jika True, simpan ke database (default False)
     """
     def decorator(func):
+        prefix = f"{func.__qualname__}:"
+        cache_manager = CacheManager()
+
+        def make_key(args, kwargs) -> str:
+            # Key stabil antar proses (hash() str diacak per proses)
+            if kwargs:
+                return prefix + repr((args, sorted(kwargs.items())))
+            return prefix + repr(args)
+
+        # Jenis fungsi ditentukan sekali di sini, bukan di setiap pemanggilan
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                cache_key = make_key(args, kwargs)
+                
+                # Coba ambil dari cache; None yang tersimpan tetap dihitung hit
+                cached_value = await cache_manager.get(cache_key, _MISS)
+                if cached_value is not _MISS:
+                    return cached_value
+                
+                result = await func(*args, **kwargs)
+                await cache_manager.set(cache_key, result, expires_in, permanent)
+                return result
+        else:
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                cache_key = make_key(args, kwargs)
+                
+                cached_value = await cache_manager.get(cache_key, _MISS)
+                if cached_value is not _MISS:
+                    return cached_value
+                
+                result = func(*args, **kwargs)
+                await cache_manager.set(cache_key, result, expires_in, permanent)
+                return result
+        return wrapper
+    return decorator
+
+def async_ttl_cache(time_to_live: int = 3600, maxsize: int = 10000, skip_args: int = 1):
+    """
+    Decorator untuk cache in-process (LRU + TTL) pada coroutine
+    
+    Hasil None tidak disimpan. Entry dapat dihapus lewat
+    `func.cache_invalidate(*args)` (tanpa argumen yang di-skip) atau
+    semuanya lewat `func.cache_clear()`. Nilai yang sudah diketahui
+    dapat langsung disimpan lewat `func.cache_set(value, *args)`.
+    
+    Args:
+        time_to_live: Waktu kadaluarsa dalam detik (default 1 jam)
+        maxsize: Jumlah maksimum entry sebelum entry terlama dibuang
+        skip_args: Jumlah argumen posisi awal yang tidak masuk key (default 1 untuk self)
+    """
+    def decorator(func):
+        entries: OrderedDict = OrderedDict()
+
+        def make_key(args, kwargs):
+            if kwargs:
+                return tuple(args) + tuple(sorted(kwargs.items()))
+            return tuple(args)
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            cache_key = f"{func.__name__}:{hash(str(args))}-{hash(str(kwargs))}"
-            cache_manager = CacheManager()
-            
-            # Coba ambil dari cache
-            cached_value = await cache_manager.get(cache_key)
-            if cached_value is not None:
-                return cached_value
-            
-            # Jika tidak ada di cache, eksekusi fungsi
-            result = await func(*args, **kwargs) if asyncio.iscoroutinefunction(func) else func(*args, **kwargs)
-            
-            # Simpan ke cache
-            await cache_manager.set(cache_key, result, expires_in, permanent)
-            
+            key = make_key(args[skip_args:], kwargs)
+            entry = entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    entries.move_to_end(key)
+                    return entry[1]
+                del entries[key]
+
+            result = await func(*args, **kwargs)
+            if result is not None:
+                entries[key] = (time.monotonic() + time_to_live, result)
+                if len(entries) > maxsize:
+                    entries.popitem(last=False)
             return result
+
+        def cache_invalidate(*args, **kwargs):
+            entries.pop(make_key(args, kwargs), None)
+
+        def cache_set(value, *args, **kwargs):
+            key = make_key(args, kwargs)
+            entries[key] = (time.monotonic() + time_to_live, value)
+            entries.move_to_end(key)
+            if len(entries) > maxsize:
+                entries.popitem(last=False)
+
+        wrapper.cache_invalidate = cache_invalidate
+        wrapper.cache_set = cache_set
+        wrapper.cache_clear = entries.clear
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
@@ -1,11 +1,15 @@
 import discord
 from enum import Enum
 from collections import namedtuple
+from dataclasses import dataclass, field
+from types import MappingProxyType
 from typing import Dict, List
 
 # Timeouts and Intervals
 COOLDOWN_SECONDS = 3
 UPDATE_INTERVAL = 55  # seconds
+STOCK_UPDATE_MIN_INTERVAL = 5  # seconds, jeda minimum antar edit embed stok
+STOCK_REFRESH_INTERVAL = 600  # seconds, refresh embed stok walau tidak ada event
 CACHE_TIMEOUT = 60
 PAGE_TIMEOUT = 60  # seconds
 ADMIN_CONFIRM_TIMEOUT = 30  # seconds
@@ -84,8 +88,8 @@ COLORS = {
     'warning': discord.Color.yellow()
 }
 
-# Messages
-MESSAGES = {
+# Messages (read-only view; templates never change at runtime)
+MESSAGES = MappingProxyType({
     'ERROR_GENERIC': "❌ An error occurred. Please try again later.",
     'NO_PERMISSION': "❌ You don't have permission to use this command.",
     'COOLDOWN': "⚠️ Please wait {seconds} seconds before using this command again.",
@@ -106,7 +110,7 @@ MESSAGES = {
     'NO_ITEMS_FOUND': "❌ No items found in file!",
     'STOCK_ADDED': "✅ Stock items successfully added!",
     'PROCESSING': "⏳ Processing... Please wait..."
-}
+})
 
 # Database Settings
 DB_FILE = 'shop.db'
@@ -141,13 +145,23 @@ class ValidationError(Exception):
     """Custom exception for validation-related errors"""
     pass
 
+# Rates resolved once for Balance arithmetic
+_DL_RATE = CURRENCY_RATES['DL']
+_BGL_RATE = CURRENCY_RATES['BGL']
+
 # Balance Class
+@dataclass(frozen=True, slots=True)
 class Balance:
-    def __init__(self, wl: int = 0, dl: int = 0, bgl: int = 0):
-        self.wl = wl
-        self.dl = dl
-        self.bgl = bgl
-        self.total_wls = self.to_wls()
+    wl: int = 0
+    dl: int = 0
+    bgl: int = 0
+    # Total balance in WLs, computed once at construction
+    total_wls: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(
+            self, 'total_wls', self.wl + (self.dl * _DL_RATE) + (self.bgl * _BGL_RATE)
+        )
     
     def format(self) -> str:
         """Format balance in human readable string"""
@@ -162,23 +176,18 @@ class Balance:
     
     def to_wls(self) -> int:
         """Convert balance to total WLs"""
-        return self.wl + (self.dl * CURRENCY_RATES['DL']) + (self.bgl * CURRENCY_RATES['BGL'])
+        return self.total_wls
     
     @classmethod
     def from_wls(cls, total_wls: int) -> 'Balance':
         """Create Balance instance from total WLs"""
-        bgl = total_wls // CURRENCY_RATES['BGL']
-        remaining = total_wls % CURRENCY_RATES['BGL']
-        dl = remaining // CURRENCY_RATES['DL']
-        wl = remaining % CURRENCY_RATES['DL']
+        bgl, remaining = divmod(total_wls, _BGL_RATE)
+        dl, wl = divmod(remaining, _DL_RATE)
         return cls(wl=wl, dl=dl, bgl=bgl)
 
     def __str__(self) -> str:
         return self.format()
 
-    def __repr__(self) -> str:
-        return f"Balance(wl={self.wl}, dl={self.dl}, bgl={self.bgl})"
-
 # Exports
 __all__ = [
     'TransactionType',
@@ -5,7 +5,9 @@ from datetime import datetime
 import json
 import asyncio
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from database import get_connection
+from database import run_in_transaction
+from .balance_manager import BalanceManagerService
+from .cache_manager import CacheManager
 from .constants import (
     Balance,         # Untuk perhitungan balance
     TransactionError,# Untuk error handling
@@ -19,6 +21,7 @@ with open('config.json') as config_file:
 
 DONATION_LOG_CHANNEL_ID = int(config['id_donation_log'])
 PORT = 8081
+DONATION_TIMEOUT = 30  # seconds to wait for the bot loop to process a donation
 
 class DonationManager:
     """Manager class for handling donations"""
@@ -53,9 +56,7 @@ class DonationManager:
 
     async def process_donation(self, growid: str, wl: int, dl: int, bgl: int) -> Balance:
         """Process a donation"""
-        conn = None
-        try:
-            conn = get_connection()
+        def donate(conn) -> Balance:
             cursor = conn.cursor()
             
             # Get current balance
@@ -111,18 +112,15 @@ class DonationManager:
                 new_balance.format(),
                 total_wls
             ))
-            
-            conn.commit()
             return new_balance
-            
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            raise e
-            
-        finally:
-            if conn:
-                conn.close()
+
+        # Runs on the writer connection in a worker thread; commits or rolls back as one
+        new_balance = await asyncio.to_thread(run_in_transaction, donate)
+
+        # Drop cached balance/history after commit so readers see the donation
+        BalanceManagerService.get(self.bot).get_balance.cache_invalidate(growid)
+        await CacheManager().delete_many([f"balance_{growid}", f"trx_history_{growid}"])
+        return new_balance
 
     async def log_to_discord(self, channel_id: int, growid: str, wl: int, dl: int, bgl: int, new_balance: Balance):
         """Log donation to Discord channel"""
@@ -171,17 +169,19 @@ class DonateHandler(BaseHTTPRequestHandler):
             # Parse deposit amounts
             wl, dl, bgl = self.manager.parse_deposit(deposit)
             
-            # Process donation using asyncio
-            loop = asyncio.get_event_loop()
-            new_balance = loop.run_until_complete(
-                self.manager.process_donation(growid, wl, dl, bgl)
-            )
+            # Donation runs on the bot's event loop: the caches and Discord
+            # client it touches belong to that loop, not to this server thread
+            loop = self.bot.loop
+            new_balance = asyncio.run_coroutine_threadsafe(
+                self.manager.process_donation(growid, wl, dl, bgl),
+                loop
+            ).result(timeout=DONATION_TIMEOUT)
             
             # Send success response
             self.send_success_response(growid, wl, dl, bgl, new_balance)
             
-            # Log to Discord
-            loop.run_until_complete(
+            # Log to Discord without holding the HTTP response
+            asyncio.run_coroutine_threadsafe(
                 self.manager.log_to_discord(
                     DONATION_LOG_CHANNEL_ID,
                     growid, 
@@ -189,7 +189,8 @@ class DonateHandler(BaseHTTPRequestHandler):
                     dl, 
                     bgl, 
                     new_balance
-                )
+                ),
+                loop
             )
             
         except json.JSONDecodeError:
@@ -1,7 +1,6 @@
 import logging
-import asyncio
 from typing import Optional, List, Dict
-from datetime import datetime
+from datetime import datetime, timezone
 
 import discord
 from discord.ext import commands
@@ -17,6 +16,25 @@ from .base_handler import BaseLockHandler
 from .cache_manager import CacheManager
 from .product_manager import ProductManagerService
 from .balance_manager import BalanceManagerService
+from .trx import TransactionManager
+
+_YML_OPEN = "```yml\n"
+_YML_CLOSE = "```"
+
+# Emoji per tipe transaksi untuk riwayat; tipe lain memakai 💸
+_TRX_EMOJI = {
+    TransactionType.DEPOSIT: "💰",
+    TransactionType.PURCHASE: "🛒",
+}
+
+def attach_services(bot) -> None:
+    """Pasang service bersama ke bot sekali, agar cache-nya tetap hangat antar interaksi"""
+    if getattr(bot, 'balance_manager', None) is None:
+        bot.balance_manager = BalanceManagerService.get(bot)
+    if getattr(bot, 'product_manager', None) is None:
+        bot.product_manager = ProductManagerService.get(bot)
+    if getattr(bot, 'trx_manager', None) is None:
+        bot.trx_manager = TransactionManager.get(bot)
 
 class ShopView(View):
     """
@@ -25,8 +43,9 @@ class ShopView(View):
     def __init__(self, bot):
         super().__init__(timeout=None)  # View persisten tanpa timeout
         self.bot = bot
-        self.balance_manager = BalanceManagerService(bot)
-        self.product_manager = ProductManagerService(bot)
+        attach_services(bot)
+        self.balance_manager = bot.balance_manager
+        self.product_manager = bot.product_manager
         self.logger = logging.getLogger("ShopView")
 
     # Perbaikan untuk tombol register
@@ -38,8 +57,9 @@ class ShopView(View):
     async def register_callback(self, interaction: discord.Interaction, button: Button):
         """Callback untuk tombol pendaftaran"""
         try:
-            # Cek apakah user sudah terdaftar
-            existing_growid = await self.balance_manager.get_growid(str(interaction.user.id))
+            # Cek cepat dari memory saja; query database bisa melewati batas
+            # 3 detik interaction. Modal memvalidasi ulang saat submit.
+            existing_growid = self.balance_manager.peek_growid(str(interaction.user.id))
             if existing_growid:
                 await interaction.response.send_message(
                     embed=discord.Embed(
@@ -93,7 +113,7 @@ class ShopView(View):
             
             embed.add_field(
                 name="Saldo Saat Ini",
-                value=f"```yml\n{balance.format()}```",
+                value=f"{_YML_OPEN}{balance.format()}{_YML_CLOSE}",
                 inline=False
             )
             
@@ -106,12 +126,12 @@ class ShopView(View):
                 ])
                 embed.add_field(
                     name="Transaksi Terakhir",
-                    value=f"```yml\n{latest_transactions}```",
+                    value=f"{_YML_OPEN}{latest_transactions}{_YML_CLOSE}",
                     inline=False
                 )
 
             embed.set_footer(text="Diperbarui")
-            embed.timestamp = datetime.utcnow()
+            embed.timestamp = discord.utils.utcnow()
             
             await interaction.followup.send(embed=embed, ephemeral=True)
 
@@ -139,10 +159,13 @@ class ShopView(View):
 
             # Ambil produk yang tersedia
             products = await self.product_manager.get_all_products()
+            counts = await self.product_manager.get_stock_counts(
+                [product['code'] for product in products]
+            )
             available_products = []
             
             for product in products:
-                stock_count = await self.product_manager.get_stock_count(product['code'])
+                stock_count = counts.get(product['code'], 0)
                 if stock_count > 0:
                     product['stock'] = stock_count
                     available_products.append(product)
@@ -207,28 +230,24 @@ class ShopView(View):
             )
 
             for i, trx in enumerate(history, 1):
-                # Emoji transaksi
-                emoji = "💰" if trx['type'] == TransactionType.DEPOSIT.value else "🛒" if trx['type'] == TransactionType.PURCHASE.value else "💸"
-                
-                # Format timestamp
-                timestamp = datetime.fromisoformat(trx['created_at'].replace('Z', '+00:00'))
+                emoji = _TRX_EMOJI.get(trx['type'], "💸")
                 
                 embed.add_field(
                     name=f"{emoji} Transaksi #{i}",
                     value=(
-                        f"```yml\n"
+                        # Timestamp Discord dirender sesuai zona waktu tiap user,
+                        # tapi tidak jalan di dalam code block
+                        f"📅 <t:{trx['created_at_ts']}:F>\n{_YML_OPEN}"
                         f"Tipe: {trx['type']}\n"
-                        f"Tanggal: {timestamp.strftime('%Y-%m-%d %H:%M:%S')} UTC\n"
                         f"Detail: {trx['details']}\n"
                         f"Saldo Awal: {trx['old_balance']}\n"
-                        f"Saldo Akhir: {trx['new_balance']}\n"
-                        f"```"
+                        f"Saldo Akhir: {trx['new_balance']}\n{_YML_CLOSE}"
                     ),
                     inline=False
                 )
 
             embed.set_footer(text="Menampilkan 5 transaksi terakhir")
-            embed.timestamp = datetime.utcnow()
+            embed.timestamp = discord.utils.utcnow()
             
             await interaction.followup.send(embed=embed, ephemeral=True)
 
@@ -256,12 +275,16 @@ class RegisterModal(discord.ui.Modal):
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         try:
-            balance_manager = BalanceManagerService(interaction.client)
+            balance_manager = interaction.client.balance_manager
             
             # Validasi dan daftarkan GrowID
             growid = str(self.growid.value).strip()
             if not growid:
                 raise ValueError("GrowID tidak boleh kosong!")
+
+            existing_growid = await balance_manager.get_growid(str(interaction.user.id))
+            if existing_growid:
+                raise ValueError(f"Anda sudah terdaftar dengan GrowID: {existing_growid}")
                 
             await balance_manager.register_user(
                 str(interaction.user.id),
@@ -286,6 +309,8 @@ class RegisterModal(discord.ui.Modal):
 class ProductSelect(discord.ui.Select):
     """Select menu untuk memilih produk"""
     def __init__(self, products):
+        # Produk + stok sudah diambil buy_callback, dipakai ulang di callback
+        self._products_by_code = {product['code']: product for product in products}
         options = []
         for product in products:
             option = discord.SelectOption(
@@ -305,16 +330,15 @@ class ProductSelect(discord.ui.Select):
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         try:
-            product_manager = ProductManagerService(interaction.client)
-            balance_manager = BalanceManagerService(interaction.client)
-            
-            # Ambil detail produk
-            product = await product_manager.get_product(self.values[0])
+            # Stok dicek ulang saat process_purchase, jadi data dari daftar cukup
+            product = self._products_by_code.get(self.values[0])
+            if not product:
+                product = await interaction.client.product_manager.get_product_with_stock(self.values[0])
             if not product:
                 raise ValueError("Produk tidak ditemukan")
                 
             # Cek stok
-            stock = await product_manager.get_stock_count(product['code'])
+            stock = product['stock']
             if stock <= 0:
                 raise ValueError("Maaf, stok produk ini sedang habis")
                 
@@ -331,22 +355,8 @@ class ProductSelect(discord.ui.Select):
                 color=COLORS['info']
             )
             
-            # Buat tombol konfirmasi
-            view = View(timeout=180)
-            view.add_item(
-                Button(
-                    style=discord.ButtonStyle.success,
-                    label="✅ Konfirmasi",
-                    custom_id=f"confirm_purchase_{product['code']}"
-                )
-            )
-            view.add_item(
-                Button(
-                    style=discord.ButtonStyle.danger,
-                    label="❌ Batal",
-                    custom_id="cancel_purchase"
-                )
-            )
+            # Produk disimpan di view, tidak perlu custom_id dinamis
+            view = PurchaseConfirmView(product)
             
             await interaction.followup.send(
                 embed=embed,
@@ -362,10 +372,58 @@ class ProductSelect(discord.ui.Select):
             )
             await interaction.followup.send(embed=error_embed, ephemeral=True)
 
+class PurchaseConfirmView(View):
+    """Tombol konfirmasi/batal untuk satu produk yang dipilih"""
+    def __init__(self, product: Dict):
+        super().__init__(timeout=180)
+        self.product = product
+
+    @discord.ui.button(style=discord.ButtonStyle.success, label="✅ Konfirmasi")
+    async def confirm(self, interaction: discord.Interaction, button: Button):
+        # Satu view hanya untuk satu pembelian
+        self.stop()
+        await interaction.response.edit_message(view=None)
+        try:
+            result = await interaction.client.trx_manager.process_purchase(
+                str(interaction.user.id),
+                self.product['code']
+            )
+            items = "\n".join(result['content'])
+            embed = discord.Embed(
+                title="✅ Pembelian Berhasil",
+                description=f"{_YML_OPEN}{result['message']}{_YML_CLOSE}",
+                color=COLORS['success']
+            )
+            embed.add_field(
+                name="📦 Item",
+                value=f"```\n{items}```",
+                inline=False
+            )
+            await interaction.followup.send(embed=embed, ephemeral=True)
+
+        except Exception as e:
+            error_embed = discord.Embed(
+                title="❌ Error",
+                description=f"```diff\n- {str(e)}```",
+                color=COLORS['error']
+            )
+            await interaction.followup.send(embed=error_embed, ephemeral=True)
+
+    @discord.ui.button(style=discord.ButtonStyle.danger, label="❌ Batal")
+    async def cancel(self, interaction: discord.Interaction, button: Button):
+        self.stop()
+        await interaction.response.edit_message(
+            embed=discord.Embed(
+                title="❌ Dibatalkan",
+                description="Pembelian dibatalkan",
+                color=COLORS['error']
+            ),
+            view=None
+        )
+
 class LiveButtonManager(BaseLockHandler):
     """Manager untuk mengelola tombol-tombol live"""
     _instance = None
-    _instance_lock = asyncio.Lock()
 
     def __new__(cls, bot):
         if cls._instance is None:
@@ -382,59 +440,15 @@ class LiveButtonManager(BaseLockHandler):
             self.stock_channel_id = int(self.bot.config.get('id_live_stock', 0))
             self.current_button_message: Optional[discord.Message] = None
             self.stock_manager = None
+            # View persisten dipakai ulang; isinya tidak pernah berubah
+            self._shop_view = ShopView(bot)
+            self._view_message_id: Optional[int] = None
+            self._control_embed_template: Optional[discord.Embed] = None
             self.initialized = True
 
-    async def set_stock_manager(self, stock_manager):
-        """Set stock manager untuk sinkronisasi"""
-        self.stock_manager = stock_manager
-
-    async def get_or_create_button_message(self) -> Optional[discord.Message]:
-        """Ambil pesan tombol yang ada atau buat baru"""
-        if not self.stock_channel_id:
-            self.logger.error("ID channel stock belum dikonfigurasi!")
-            return None
-        channel = self.bot.get_channel(self.stock_channel_id)
-        if not channel:
-            self.logger.error(f"Channel stock dengan ID {self.stock_channel_id} tidak ditemukan")
-            return None
-        try:
-            message_id = await self.cache_manager.get("live_buttons_message_id")
-            if message_id:
-                try:
-                    message = await channel.fetch_message(message_id)
-                    self.current_button_message = message
-                    return message
-                except discord.NotFound:
-                    await self.cache_manager.delete("live_buttons_message_id")
-                except Exception as e:
-                    self.logger.error(f"Error mengambil pesan tombol: {e}")
-            # Buat pesan baru jika tidak ada
-            # TODO: Implementasi buat pesan baru
-            pass
-        except Exception as e:
-            self.logger.error(f"Error in get_or_create_button_message: {e}")
-            return None
-
-    async def update_buttons(self, edit_message: bool = False) -> bool:
-        """Update tombol-tombol"""
-        try:
-            if edit_message:
-                # Update pesan yang ada jika diminta
-                if self.current_button_message:
-                    await self.current_button_message.edit(view=ShopView(self.bot))
-                    return True
-            # Jika tidak, dapatkan atau buat pesan baru
-            message = await self.get_or_create_button_message()
-            if not message:
-                return False
-            # Update view
-            await message.edit(view=ShopView(self.bot))
-            return True
-        except Exception as e:
-            self.logger.error(f"Error updating buttons: {e}")
-            return False
-            
-            # Buat pesan baru dengan embed modern
+    def _control_embed(self) -> discord.Embed:
+        """Salinan embed Kontrol Toko; bagian statisnya dibuat sekali saja"""
+        if self._control_embed_template is None:
             embed = discord.Embed(
                 title="🎮 Kontrol Toko",
                 description=(
@@ -477,15 +491,49 @@ class LiveButtonManager(BaseLockHandler):
                 text="Sistem Toko v1.0",
                 icon_url=self.bot.user.display_avatar.url
             )
-            embed.timestamp = datetime.utcnow()
+            self._control_embed_template = embed
+        return self._control_embed_template.copy()
+
+    def register_view(self):
+        """Daftarkan ShopView persisten agar interaksi tetap ditangani setelah restart"""
+        self.bot.add_view(self._shop_view)
+
+    async def set_stock_manager(self, stock_manager):
+        """Set stock manager untuk sinkronisasi"""
+        self.stock_manager = stock_manager
+
+    async def get_or_create_button_message(self) -> Optional[discord.Message]:
+        """Ambil pesan tombol yang ada atau buat baru"""
+        if not self.stock_channel_id:
+            self.logger.error("ID channel stock belum dikonfigurasi!")
+            return None
+        channel = self.bot.get_channel(self.stock_channel_id)
+        if not channel:
+            self.logger.error(f"Channel stock dengan ID {self.stock_channel_id} tidak ditemukan")
+            return None
+        if self.current_button_message:
+            return self.current_button_message
+        try:
+            message_id = await self.cache_manager.get("live_buttons_message_id")
+            if message_id:
+                # PartialMessage cukup untuk edit, tanpa GET ke Discord.
+                # Jika pesan sudah dihapus, NotFound muncul saat edit.
+                message = channel.get_partial_message(message_id)
+                self.current_button_message = message
+                return message
+
+            # Buat pesan baru dengan embed modern
+            embed = self._control_embed()
+            embed.timestamp = discord.utils.utcnow()
             
             # Buat pesan dengan tombol
             message = await channel.send(
                 embed=embed,
-                view=ShopView(self.bot)
+                view=self._shop_view
             )
             
             self.current_button_message = message
+            self._view_message_id = message.id
             
             # Simpan ID pesan ke cache
             await self.cache_manager.set(
@@ -501,17 +549,36 @@ class LiveButtonManager(BaseLockHandler):
             self.logger.error(f"Error membuat pesan tombol: {e}")
             return None
 
-    async def update_buttons(self) -> bool:
-        """Update pesan tombol"""
+    async def update_buttons(self, force: bool = False) -> bool:
+        """
+        Pasang ShopView ke pesan tombol
+        
+        View yang sama tidak perlu di-edit ulang; gunakan force=True untuk
+        memaksa edit (misalnya setelah view diganti). Pemanggilan bersamaan
+        berbagi satu update.
+        """
+        key = "buttons_update_force" if force else "buttons_update"
+        return await self.single_flight(key, lambda: self._update_buttons(force))
+
+    async def _update_buttons(self, force: bool) -> bool:
         try:
             message = await self.get_or_create_button_message()
             if not message:
                 return False
 
-            # Update view dengan tombol baru
-            await message.edit(view=ShopView(self.bot))
+            if not force and self._view_message_id == message.id:
+                return True
+
+            await message.edit(view=self._shop_view)
+            self._view_message_id = message.id
             return True
 
+        except discord.NotFound:
+            # Pesan tersimpan sudah dihapus; update berikutnya membuat yang baru
+            self.current_button_message = None
+            self._view_message_id = None
+            await self.cache_manager.delete("live_buttons_message_id")
+            return False
         except Exception as e:
             self.logger.error(f"Error mengupdate tombol: {e}")
             return False
@@ -529,6 +596,7 @@ class LiveButtonManager(BaseLockHandler):
                     embed=embed,
                     view=None
                 )
+                self._view_message_id = None
         except Exception as e:
             self.logger.error(f"Error dalam cleanup: {e}")
 
@@ -548,6 +616,8 @@ class LiveButtonsCog(commands.Cog):
     async def cog_load(self):
         """Setup saat cog dimuat"""
         self.logger.info("LiveButtonsCog loading...")
+        attach_services(self.bot)
+        self.button_manager.register_view()
         # Dapatkan stock manager dari bot
         stock_cog = self.bot.get_cog('LiveStockCog')
         if stock_cog:
@@ -565,4 +635,4 @@ async def setup(bot):
     if not hasattr(bot, 'live_buttons_loaded'):
         await bot.add_cog(LiveButtonsCog(bot))
         bot.live_buttons_loaded = True
-        print(f'Current Date and Time (UTC - YYYY-MM-DD HH:MM:SS formatted): {datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}\nCurrent User\'s Login: {bot.user}\n')
\ No newline at end of file
+        print(f'Current Date and Time (UTC - YYYY-MM-DD HH:MM:SS formatted): {datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")}\nCurrent User\'s Login: {bot.user}\n')
\ No newline at end of file
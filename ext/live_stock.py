@@ -1,14 +1,15 @@
 import logging
 import asyncio
-from typing import Optional, Dict, List
-from datetime import datetime
+from typing import Optional, Dict, List, Tuple
+from datetime import datetime, timezone
 
 import discord
 from discord.ext import commands, tasks
 from .constants import (
     Status,          # Untuk status stok
     COLORS,         # Untuk warna embed
-    UPDATE_INTERVAL,# Untuk interval update (55 seconds)
+    STOCK_UPDATE_MIN_INTERVAL, # Jeda minimum antar update
+    STOCK_REFRESH_INTERVAL,    # Refresh berkala tanpa event
     MESSAGES,       # Untuk pesan error/status
     CACHE_TIMEOUT  # Untuk cache message ID
 )
@@ -18,9 +19,13 @@ from .base_handler import BaseLockHandler
 from .cache_manager import CacheManager
 from .product_manager import ProductManagerService
 
+_YML_OPEN = "```yml\n"
+_YML_CLOSE = "```"
+# Batas value embed field Discord dikurangi panjang fence
+_FIELD_BODY_LIMIT = 1024 - len(_YML_OPEN) - len(_YML_CLOSE)
+
 class LiveStockManager(BaseLockHandler):
     _instance = None
-    _instance_lock = asyncio.Lock()
 
     def __new__(cls, bot):
         if cls._instance is None:
@@ -34,54 +39,106 @@ class LiveStockManager(BaseLockHandler):
             self.bot = bot
             self.logger = logging.getLogger("LiveStockManager")
             self.cache_manager = CacheManager()
-            self.product_manager = ProductManagerService(bot)
+            self.product_manager = ProductManagerService.get(bot)
             self.stock_channel_id = int(self.bot.config.get('id_live_stock', 0))
             self.current_stock_message: Optional[discord.Message] = None
+            self._last_state_hash: Optional[int] = None
+            self._last_embed_signature: Optional[tuple] = None
+            self._embed_template: Optional[discord.Embed] = None
+            # Di-set oleh mark_dirty; awalnya set agar render pertama langsung jalan
+            self._stock_dirty = asyncio.Event()
+            self._stock_dirty.set()
             self.initialized = True
 
-    async def create_stock_embed(self) -> discord.Embed:
+    def mark_dirty(self) -> None:
+        """Tandai stok berubah sehingga loop update merender ulang embed"""
+        self._stock_dirty.set()
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        """Tunggu sampai stok ditandai berubah, paling lama timeout detik; False jika timeout"""
         try:
-            products = await self.product_manager.get_all_products()
-            embed = discord.Embed(
-                title="🌟 Live Stock Status",
-                description=(
-                    "```\n"
-                    "Welcome to our Growtopia Shop!\n"
-                    "Real-time stock information updated every minute\n"
-                    "```"
-                ),
-                color=COLORS['info']
-            )
-            embed.add_field(
-                name="🕒 Server Time",
-                value=f"```yml\n{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC```",
-                inline=False
-            )
-            for product in products:
-                stock_count = await self.product_manager.get_stock_count(product['code'])
-                status_emoji = "🟢" if stock_count > 0 else "🔴"
-                status_text = "Available" if stock_count > 0 else "Out of Stock"
-                field_value = (
-                    "```yml\n"
-                    f"Price: {product['price']:,} WL\n"
-                    f"Stock: {stock_count} units\n"
-                    f"Status: {status_text}\n"
-                    "```"
-                )
-                embed.add_field(
-                    name=f"{status_emoji} {product['name']} ({product['code']})",
-                    value=field_value,
-                    inline=True
-                )
-            embed.set_footer(
-                text="Last Updated",
-                icon_url=self.bot.user.display_avatar.url
+            await asyncio.wait_for(self._stock_dirty.wait(), timeout)
+            changed = True
+        except asyncio.TimeoutError:
+            changed = False
+        self._stock_dirty.clear()
+        return changed
+
+    async def _load_stock_state(self) -> Tuple[List[Dict], Dict[str, int]]:
+        products = await self.product_manager.get_all_products()
+        counts = await self.product_manager.get_stock_counts(
+            [product['code'] for product in products]
+        )
+        return products, counts
+
+    @staticmethod
+    def _state_hash(products: List[Dict], counts: Dict[str, int]) -> int:
+        """Hash dari semua data yang tampil di embed stok"""
+        return hash(tuple(
+            (product['code'], product['name'], product['price'], counts.get(product['code'], 0))
+            for product in products
+        ))
+
+    @staticmethod
+    def _embed_signature(embed: discord.Embed) -> tuple:
+        """
+        Bagian embed yang terlihat, tanpa timestamp
+
+        Dipakai untuk membandingkan embed yang baru dirender dengan yang
+        sudah tampil, termasuk embed hasil fetch_message setelah restart
+        (to_dict() hasil fetch berisi key tambahan dari Discord).
+        """
+        return (
+            embed.title,
+            embed.description,
+            tuple((field.name, field.value, field.inline) for field in embed.fields),
+        )
+
+    def _build_embed_template(self) -> discord.Embed:
+        """Bagian embed stok yang tidak berubah, dibuat sekali saja"""
+        embed = discord.Embed(
+            title="🌟 Live Stock Status",
+            description=(
+                "```\n"
+                "Welcome to our Growtopia Shop!\n"
+                "Real-time stock information, updated when stock changes\n"
+                "```"
+            ),
+            color=COLORS['info']
+        )
+        embed.set_footer(
+            text="Last Updated",
+            icon_url=self.bot.user.display_avatar.url
+        )
+        return embed
+
+    def _render_stock_embed(self, products: List[Dict], counts: Dict[str, int]) -> discord.Embed:
+        # Template dibuat saat render pertama karena bot.user baru ada setelah login
+        if self._embed_template is None:
+            self._embed_template = self._build_embed_template()
+        embed = self._embed_template.copy()
+        # Semua produk dalam satu code block; dipecah jika melebihi batas field
+        chunk: List[str] = []
+        size = 0
+        for product in products:
+            stock_count = counts.get(product['code'], 0)
+            status_emoji = "🟢" if stock_count > 0 else "🔴"
+            status_text = "Available" if stock_count > 0 else "Out of Stock"
+            line = (
+                f"{status_emoji} {product['name']} ({product['code']})\n"
+                f"  Price: {product['price']:,} WL | Stock: {stock_count} | {status_text}\n"
             )
-            embed.timestamp = datetime.utcnow()
-            return embed
-        except Exception as e:
-            self.logger.error(f"Error creating stock embed: {e}")
-            raise
+            if chunk and size + len(line) > _FIELD_BODY_LIMIT:
+                embed.add_field(name="📦 Products", value=_YML_OPEN + "".join(chunk) + _YML_CLOSE, inline=False)
+                chunk, size = [], 0
+            chunk.append(line)
+            size += len(line)
+        if chunk:
+            embed.add_field(name="📦 Products", value=_YML_OPEN + "".join(chunk) + _YML_CLOSE, inline=False)
+        # Waktu perubahan state terakhir; Discord menampilkannya di footer
+        # sesuai zona waktu masing-masing user
+        embed.timestamp = discord.utils.utcnow()
+        return embed
 
     async def get_or_create_stock_message(self) -> Optional[discord.Message]:
         if not self.stock_channel_id:
@@ -97,14 +154,24 @@ class LiveStockManager(BaseLockHandler):
                 try:
                     message = await channel.fetch_message(message_id)
                     self.current_stock_message = message
+                    # Isi pesan lama belum tentu sesuai state sekarang;
+                    # signature-nya dipakai untuk cek apakah perlu di-edit
+                    self._last_state_hash = None
+                    self._last_embed_signature = (
+                        self._embed_signature(message.embeds[0])
+                        if message.embeds and not message.content else None
+                    )
                     return message
                 except discord.NotFound:
                     await self.cache_manager.delete("live_stock_message_id")
                 except Exception as e:
                     self.logger.error(f"Error fetching stock message: {e}")
-            embed = await self.create_stock_embed()
+            products, counts = await self._load_stock_state()
+            embed = self._render_stock_embed(products, counts)
             message = await channel.send(embed=embed)
             self.current_stock_message = message
+            self._last_state_hash = self._state_hash(products, counts)
+            self._last_embed_signature = self._embed_signature(embed)
             await self.cache_manager.set(
                 "live_stock_message_id",
                 message.id,
@@ -116,14 +183,35 @@ class LiveStockManager(BaseLockHandler):
             self.logger.error(f"Error in get_or_create_stock_message: {e}")
             return None
 
-    async def update_stock_display(self) -> bool:
+    async def update_stock_display(self, force: bool = False) -> bool:
+        """
+        Update embed stok; pemanggilan bersamaan berbagi satu update
+
+        force=True selalu meng-edit pesan (refresh berkala), walaupun stok
+        tidak berubah, agar timestamp "Last Updated" ikut diperbarui.
+        """
+        return await self.single_flight(
+            "stock_display_update", lambda: self._update_stock_display(force)
+        )
+
+    async def _update_stock_display(self, force: bool = False) -> bool:
         try:
             if not self.current_stock_message:
                 self.current_stock_message = await self.get_or_create_stock_message()
             if not self.current_stock_message:
                 return False
-            embed = await self.create_stock_embed()
-            await self.current_stock_message.edit(embed=embed)
+            products, counts = await self._load_stock_state()
+            state_hash = self._state_hash(products, counts)
+            if not force and state_hash == self._last_state_hash:
+                # Tidak ada perubahan, lewati PATCH ke Discord
+                return True
+            embed = self._render_stock_embed(products, counts)
+            signature = self._embed_signature(embed)
+            if force or signature != self._last_embed_signature:
+                # content=None menghapus teks offline yang ditulis cleanup
+                await self.current_stock_message.edit(content=None, embed=embed)
+                self._last_embed_signature = signature
+            self._last_state_hash = state_hash
             return True
         except Exception as e:
             self.logger.error(f"Error updating stock display: {e}")
@@ -136,6 +224,8 @@ class LiveStockManager(BaseLockHandler):
                     content="Shop is currently offline. Please wait...",
                     embed=None
                 )
+                self._last_state_hash = None
+                self._last_embed_signature = None
         except Exception as e:
             self.logger.error(f"Error in cleanup: {e}")
             
@@ -146,20 +236,27 @@ class LiveStockCog(commands.Cog):
         self.logger = logging.getLogger("LiveStockCog")
         self.update_stock.start()
 
-    @tasks.loop(seconds=UPDATE_INTERVAL)  # Menggunakan UPDATE_INTERVAL dari constants
+    @tasks.loop(seconds=STOCK_UPDATE_MIN_INTERVAL)
     async def update_stock(self):
-        """Update stock display periodically"""
+        """Update stock display saat stok berubah, atau tiap STOCK_REFRESH_INTERVAL"""
         try:
-            await self.stock_manager.update_stock_display()
+            changed = await self.stock_manager.wait_for_change(STOCK_REFRESH_INTERVAL)
+            # Tanpa event (timeout) tetap edit supaya timestamp tidak basi
+            await self.stock_manager.update_stock_display(force=not changed)
         except Exception as e:
             self.logger.error(f"Error in stock update loop: {e}")
 
+    @commands.Cog.listener()
+    async def on_stock_changed(self, product_code: Optional[str] = None):
+        """Dipicu lewat bot.dispatch("stock_changed") setelah stok/produk berubah"""
+        self.stock_manager.mark_dirty()
+
     @update_stock.before_loop
     async def before_update_stock(self):
         """Wait until bot is ready before starting the loop"""
         await self.bot.wait_until_ready()
         # Ubah format output agar tidak ada prefix f-string
-        print('Current Date and Time (UTC - YYYY-MM-DD HH:MM:SS formatted): ' + datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
+        print('Current Date and Time (UTC - YYYY-MM-DD HH:MM:SS formatted): ' + datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
         print('Current User\'s Login: ' + str(self.bot.user))
     
     async def cog_unload(self):
@@ -1,6 +1,7 @@
 import logging
 import asyncio
-from typing import Dict, List, Optional
+import time
+from typing import Dict, List, Optional, Sequence
 from datetime import datetime
 
 import discord
@@ -12,53 +13,91 @@ from .constants import (
     CACHE_TIMEOUT,  # Untuk cache produk
     MESSAGES        # Untuk pesan error/success
 )
-from database import get_connection
+from database import fetch_rows, run_in_transaction
 from .base_handler import BaseLockHandler
 from .cache_manager import CacheManager
 
+logger = logging.getLogger(__name__)
+
+# Hot-path queries live at module level so every call passes the identical
+# string and hits sqlite3's per-connection prepared statement cache
+_SELECT_PRODUCT = "SELECT code, name, price, description FROM products WHERE code = ? COLLATE NOCASE"
+_PRODUCT_EXISTS = "SELECT 1 FROM products WHERE code = ? COLLATE NOCASE LIMIT 1"
+_SELECT_ALL_PRODUCTS = "SELECT code, name, price, description FROM products ORDER BY code"
+_SELECT_PRODUCTS_PAGE = """
+    SELECT code, name, price, description
+    FROM products
+    ORDER BY code
+    LIMIT ? OFFSET ?
+"""
+_SELECT_AVAILABLE_STOCK = """
+    SELECT id, content, added_at
+    FROM stock
+    WHERE product_code = ? AND status = ?
+    ORDER BY added_at ASC
+    LIMIT ?
+"""
+_SELECT_PRODUCT_WITH_STOCK = """
+    SELECT p.code, p.name, p.price, p.description, (
+        SELECT COUNT(*) FROM stock s
+        WHERE s.product_code = p.code AND s.status = ?
+    ) AS stock
+    FROM products p
+    WHERE p.code = ? COLLATE NOCASE
+"""
+_COUNT_AVAILABLE_STOCK = """
+    SELECT COUNT(*) as count 
+    FROM stock 
+    WHERE product_code = ? AND status = ?
+"""
+_SELECT_WORLD_INFO = "SELECT world, owner, bot, updated_at FROM world_info WHERE id = 1"
+
+# world_info is a single row; keep it on the service instead of the cache backend
+WORLD_INFO_TTL = 300  # seconds
+
 class ProductManagerService(BaseLockHandler):
     _instance = None
-    _instance_lock = asyncio.Lock()
 
     def __new__(cls, bot):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.initialized = False
+            instance = super().__new__(cls)
+            instance._setup(bot)
+            cls._instance = instance
         return cls._instance
 
     def __init__(self, bot):
-        if not self.initialized:
-            super().__init__()  # Initialize BaseLockHandler
-            self.bot = bot
-            self.logger = logging.getLogger("ProductManagerService")
-            self.cache_manager = CacheManager()
-            self.initialized = True
+        # State is built exactly once in __new__; repeated construction is a no-op
+        pass
 
-    async def create_product(self, code: str, name: str, price: int, description: str = None) -> Dict:
-        """Create a new product with proper locking and cache invalidation"""
-        lock = await self.acquire_lock(f"product_create_{code}")
-        if not lock:
-            raise TransactionError("System is busy, please try again later")
+    @classmethod
+    def get(cls, bot) -> "ProductManagerService":
+        """Return the shared instance, skipping the constructor once it exists"""
+        return cls._instance or cls(bot)
 
-        conn = None
-        try:
-            # Check if product already exists
-            existing = await self.get_product(code)
-            if existing:
+    def _setup(self, bot):
+        BaseLockHandler.__init__(self)
+        self.bot = bot
+        self.cache_manager = CacheManager()
+        self._world_info: Optional[Dict] = None
+        self._world_info_expiry = 0.0  # time.monotonic() deadline
+
+    async def create_product(self, code: str, name: str, price: int, description: str = None) -> Dict:
+        """Create a new product and invalidate the product caches"""
+        def insert(conn):
+            # Checked inside the transaction; BEGIN IMMEDIATE serializes creators
+            if conn.execute(_PRODUCT_EXISTS, (code,)).fetchone() is not None:
                 raise TransactionError(f"Product with code '{code}' already exists")
 
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
+            conn.execute(
                 """
                 INSERT INTO products (code, name, price, description)
                 VALUES (?, ?, ?, ?)
                 """,
                 (code, name, price, description)
             )
-            
-            conn.commit()
+
+        try:
+            await asyncio.to_thread(run_in_transaction, insert)
             
             result = {
                 'code': code,
@@ -69,20 +108,16 @@ class ProductManagerService(BaseLockHandler):
             
             # Update cache with new system
             await self.cache_manager.set(f"product_{code}", result)
-            await self.cache_manager.delete("all_products")  # Invalidate all products cache
+            # Invalidate all products cache and any remembered "not found" for this code
+            await self.cache_manager.delete_many(["all_products", f"product_miss_{code.casefold()}"])
+            self.bot.dispatch("stock_changed", code)
             
-            self.logger.info(f"Product created: {code}")
+            logger.info("Product created: %s", code)
             return result
 
         except Exception as e:
-            self.logger.error(f"Error creating product: {e}")
-            if conn:
-                conn.rollback()
+            logger.error("Error creating product: %s", e)
             raise
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock(f"product_create_{code}")
 
     async def get_product(self, code: str) -> Optional[Dict]:
         """Get product with caching"""
@@ -90,151 +125,150 @@ class ProductManagerService(BaseLockHandler):
         cached = await self.cache_manager.get(cache_key)
         if cached:
             return cached
-
-        lock = await self.acquire_lock(f"product_get_{code}")
-        if not lock:
-            self.logger.warning(f"Failed to acquire lock for getting product {code}")
+        # Codes are matched NOCASE, so misses are remembered case-folded
+        if self.cache_manager.peek(f"product_miss_{code.casefold()}"):
             return None
 
+        # Reads need no lock under WAL; single_flight only merges concurrent misses
+        return await self.single_flight(cache_key, lambda: self._load_product(code))
+
+    async def _load_product(self, code: str) -> Optional[Dict]:
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "SELECT * FROM products WHERE code = ? COLLATE NOCASE",
-                (code,)
+            result = await asyncio.to_thread(
+                fetch_rows,
+                _SELECT_PRODUCT,
+                (code,),
+                True
             )
-            
-            result = cursor.fetchone()
             if result:
                 product = dict(result)
-                await self.cache_manager.set(cache_key, product, expires_in=3600)  # Cache for 1 hour
+                await self.cache_manager.set(f"product_{code}", product, expires_in=3600)  # Cache for 1 hour
                 return product
+            # Remember unknown codes briefly so typos don't probe the DB every time
+            await self.cache_manager.set(f"product_miss_{code.casefold()}", True, expires_in=60)
             return None
 
         except Exception as e:
-            self.logger.error(f"Error getting product: {e}")
+            logger.error("Error getting product: %s", e)
             return None
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock(f"product_get_{code}")
 
     async def get_all_products(self) -> List[Dict]:
         """Get all products with caching"""
-        cached = await self.cache_manager.get("all_products")
-        if cached:
-            return cached
-
-        lock = await self.acquire_lock("products_getall")
-        if not lock:
-            self.logger.warning("Failed to acquire lock for getting all products")
+        try:
+            # single_flight so concurrent misses share one query
+            return await self.cache_manager.get_or_set(
+                "all_products",
+                lambda: self.single_flight("products_getall", self._load_all_products),
+                expires_in=300  # Cache for 5 minutes; create_product invalidates
+            )
+        except Exception as e:
+            logger.error("Error getting all products: %s", e)
             return []
 
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT * FROM products ORDER BY code")
-            
-            products = [dict(row) for row in cursor.fetchall()]
-            await self.cache_manager.set("all_products", products, expires_in=300)  # Cache for 5 minutes
-            return products
+    async def _load_all_products(self) -> List[Dict]:
+        rows = await asyncio.to_thread(fetch_rows, _SELECT_ALL_PRODUCTS)
+        return [dict(row) for row in rows]
+
+    async def get_products_page(self, limit: int = 25, offset: int = 0) -> List[Dict]:
+        """
+        Get one page of products ordered by code
+
+        Served from the cached full list when it is warm; otherwise only
+        the requested rows are read, using the products primary key order.
+        """
+        cached = self.cache_manager.peek("all_products")
+        if cached is not None:
+            return cached[offset:offset + limit]
 
+        try:
+            rows = await asyncio.to_thread(fetch_rows, _SELECT_PRODUCTS_PAGE, (limit, offset))
+            return [dict(row) for row in rows]
         except Exception as e:
-            self.logger.error(f"Error getting all products: {e}")
+            logger.error("Error getting products page: %s", e)
             return []
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock("products_getall")
 
     async def add_stock_item(self, product_code: str, content: str, added_by: str) -> bool:
-        """Add stock item with proper locking"""
-        lock = await self.acquire_lock(f"stock_add_{product_code}")
-        if not lock:
-            raise TransactionError("System is busy, please try again later")
-
-        conn = None
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
+        """Add stock item and invalidate its stock caches"""
+        def insert(conn):
             # Verify product exists
-            cursor.execute(
-                "SELECT code FROM products WHERE code = ? COLLATE NOCASE",
-                (product_code,)
-            )
-            if not cursor.fetchone():
+            if conn.execute(_PRODUCT_EXISTS, (product_code,)).fetchone() is None:
                 raise TransactionError(f"Product {product_code} not found")
             
-            cursor.execute(
+            conn.execute(
                 """
                 INSERT INTO stock (product_code, content, added_by, status)
                 VALUES (?, ?, ?, ?)
                 """,
-                (product_code, content, added_by, STATUS_AVAILABLE)
+                (product_code, content, added_by, Status.AVAILABLE)
             )
+
+        try:
+            await asyncio.to_thread(run_in_transaction, insert)
             
-            conn.commit()
-            
-            # Invalidate relevant caches
-            await self.cache_manager.delete(f"stock_count_{product_code}")
-            await self.cache_manager.delete(f"stock_{product_code}")
+            await self.invalidate_stock_cache(product_code)
+            self.bot.dispatch("stock_changed", product_code)
             
-            self.logger.info(f"Stock added for {product_code}")
+            logger.info("Stock added for %s", product_code)
             return True
 
         except Exception as e:
-            self.logger.error(f"Error adding stock item: {e}")
-            if conn:
-                conn.rollback()
+            logger.error("Error adding stock item: %s", e)
             raise
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock(f"stock_add_{product_code}")
-
-    async def get_available_stock(self, product_code: str, quantity: int = 1) -> List[Dict]:
-        """Get available stock with proper locking"""
-        cache_key = f"stock_{product_code}_q{quantity}"
-        cached = await self.cache_manager.get(cache_key)
-        if cached:
-            return cached
 
-        lock = await self.acquire_lock(f"stock_get_{product_code}")
-        if not lock:
-            raise TransactionError("System is busy, please try again later")
+    async def invalidate_stock_cache(self, product_code: str, extra_keys: Sequence[str] = ()) -> None:
+        """
+        Invalidate the cached stock count of a product
+        
+        extra_keys are deleted in the same batch, for callers that also
+        need to drop related entries (e.g. a buyer's history).
+        """
+        await self.cache_manager.delete_many([f"stock_count_{product_code}", *extra_keys])
 
+    async def get_available_stock(self, product_code: str, quantity: int = 1) -> List[Dict]:
+        """
+        Get the oldest available stock items
+        
+        Not cached: stock changes on every purchase, and the indexed read
+        is cheaper than the cache round trips plus invalidation.
+        """
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT id, content, added_at
-                FROM stock
-                WHERE product_code = ? AND status = ?
-                ORDER BY added_at ASC
-                LIMIT ?
-            """, (product_code, STATUS_AVAILABLE, quantity))
+            rows = await asyncio.to_thread(
+                fetch_rows, _SELECT_AVAILABLE_STOCK, (product_code, Status.AVAILABLE, quantity)
+            )
             
-            result = [{
+            return [{
                 'id': row['id'],
                 'content': row['content'],
                 'added_at': row['added_at']
-            } for row in cursor.fetchall()]
-
-            # Cache for a short time since this is frequently changing data
-            await self.cache_manager.set(cache_key, result, expires_in=30)
-            return result
+            } for row in rows]
 
         except Exception as e:
-            self.logger.error(f"Error getting available stock: {e}")
+            logger.error("Error getting available stock: %s", e)
             raise
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock(f"stock_get_{product_code}")
+
+    async def get_product_with_stock(self, code: str) -> Optional[Dict]:
+        """Get product together with its available stock count in one query"""
+        product = await self.cache_manager.get(f"product_{code}")
+        stock = await self.cache_manager.get(f"stock_count_{code}")
+        if product and stock is not None:
+            return {**product, 'stock': stock}
+
+        try:
+            row = await asyncio.to_thread(
+                fetch_rows, _SELECT_PRODUCT_WITH_STOCK, (Status.AVAILABLE, code), True
+            )
+            if not row:
+                return None
+
+            result = dict(row)
+            stock = result.pop('stock')
+            await self.cache_manager.set(f"product_{code}", result, expires_in=3600)  # Cache for 1 hour
+            await self.cache_manager.set(f"stock_count_{code}", stock, expires_in=30)  # Cache for 30 seconds
+            return {**result, 'stock': stock}
+
+        except Exception as e:
+            logger.error("Error getting product with stock: %s", e)
+            return None
 
     async def get_stock_count(self, product_code: str) -> int:
         """Get stock count with caching"""
@@ -243,51 +277,67 @@ class ProductManagerService(BaseLockHandler):
         if cached is not None:
             return cached
 
-        lock = await self.acquire_lock(f"stock_count_{product_code}")
-        if not lock:
-            self.logger.warning(f"Failed to acquire lock for stock count {product_code}")
-            return 0
+        return await self.single_flight(cache_key, lambda: self._load_stock_count(product_code))
 
+    async def _load_stock_count(self, product_code: str) -> int:
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) as count 
-                FROM stock 
-                WHERE product_code = ? AND status = ?
-            """, (product_code, STATUS_AVAILABLE))
+            row = await asyncio.to_thread(
+                fetch_rows, _COUNT_AVAILABLE_STOCK, (product_code, Status.AVAILABLE), True
+            )
             
-            result = cursor.fetchone()['count']
-            await self.cache_manager.set(cache_key, result, expires_in=30)  # Cache for 30 seconds
+            result = row['count']
+            await self.cache_manager.set(f"stock_count_{product_code}", result, expires_in=30)  # Cache for 30 seconds
             return result
 
         except Exception as e:
-            self.logger.error(f"Error getting stock count: {e}")
+            logger.error("Error getting stock count: %s", e)
             return 0
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock(f"stock_count_{product_code}")
 
-    async def update_stock_status(self, stock_id: int, status: str, buyer_id: str = None) -> bool:
-        """Update stock status with proper locking"""
-        lock = await self.acquire_lock(f"stock_update_{stock_id}")
-        if not lock:
-            raise TransactionError("System is busy, please try again later")
+    async def get_stock_counts(self, product_codes: List[str]) -> Dict[str, int]:
+        """Get available stock counts for many products with one query"""
+        counts: Dict[str, int] = {}
+        missing: List[str] = []
+        for code in product_codes:
+            cached = await self.cache_manager.get(f"stock_count_{code}")
+            if cached is not None:
+                counts[code] = cached
+            else:
+                missing.append(code)
+
+        if not missing:
+            return counts
 
-        conn = None
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
+            placeholders = ",".join("?" * len(missing))
+            rows = await asyncio.to_thread(fetch_rows, f"""
+                SELECT product_code, COUNT(*) as count
+                FROM stock
+                WHERE product_code IN ({placeholders}) AND status = ?
+                GROUP BY product_code
+            """, (*missing, Status.AVAILABLE))
+
+            found = {row['product_code']: row['count'] for row in rows}
+            for code in missing:
+                counts[code] = found.get(code, 0)
+                await self.cache_manager.set(f"stock_count_{code}", counts[code], expires_in=30)
+            return counts
+
+        except Exception as e:
+            logger.error("Error getting stock counts: %s", e)
+            for code in missing:
+                counts.setdefault(code, 0)
+            return counts
+
+    async def update_stock_status(self, stock_id: int, status: str, buyer_id: str = None) -> bool:
+        """Update stock status and invalidate its product's stock caches"""
+        def update(conn) -> str:
             # Get product code first for cache invalidation
-            cursor.execute("SELECT product_code FROM stock WHERE id = ?", (stock_id,))
-            product_result = cursor.fetchone()
+            product_result = conn.execute(
+                "SELECT product_code FROM stock WHERE id = ?", (stock_id,)
+            ).fetchone()
             if not product_result:
                 raise TransactionError(f"Stock item {stock_id} not found")
             
-            product_code = product_result['product_code']
-            
             update_query = """
                 UPDATE stock 
                 SET status = ?, updated_at = CURRENT_TIMESTAMP
@@ -301,100 +351,72 @@ class ProductManagerService(BaseLockHandler):
             update_query += " WHERE id = ?"
             params.append(stock_id)
 
-            cursor.execute(update_query, params)
-            conn.commit()
+            conn.execute(update_query, params)
+            return product_result['product_code']
+
+        try:
+            product_code = await asyncio.to_thread(run_in_transaction, update)
             
-            # Invalidate relevant caches
-            await self.cache_manager.delete(f"stock_count_{product_code}")
-            await self.cache_manager.delete(f"stock_{product_code}")
-            # Also invalidate any quantity specific caches
-            for i in range(1, 101):  # Reasonable range for quantities
-                await self.cache_manager.delete(f"stock_{product_code}_q{i}")
+            await self.invalidate_stock_cache(product_code)
+            self.bot.dispatch("stock_changed", product_code)
             
-            self.logger.info(f"Stock {stock_id} status updated to {status}")
+            logger.info("Stock %s status updated to %s", stock_id, status)
             return True
 
         except Exception as e:
-            self.logger.error(f"Error updating stock status: {e}")
-            if conn:
-                conn.rollback()
+            logger.error("Error updating stock status: %s", e)
             return False
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock(f"stock_update_{stock_id}")
 
     async def get_world_info(self) -> Optional[Dict]:
-        """Get world info with caching"""
-        cached = await self.cache_manager.get("world_info")
-        if cached:
-            return cached
+        """Get world info, served from the instance until WORLD_INFO_TTL expires"""
+        if time.monotonic() < self._world_info_expiry:
+            return self._world_info
 
-        lock = await self.acquire_lock("world_info_get")
-        if not lock:
-            self.logger.warning("Failed to acquire lock for world info")
-            return None
+        return await self.single_flight("world_info", self._load_world_info)
 
+    async def _load_world_info(self) -> Optional[Dict]:
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT * FROM world_info WHERE id = 1")
-            result = cursor.fetchone()
+            result = await asyncio.to_thread(
+                fetch_rows, _SELECT_WORLD_INFO, (), True
+            )
             
             if result:
                 info = dict(result)
-                await self.cache_manager.set("world_info", info, expires_in=300)  # Cache for 5 minutes
+                self._world_info = info
+                self._world_info_expiry = time.monotonic() + WORLD_INFO_TTL
                 return info
             return None
 
         except Exception as e:
-            self.logger.error(f"Error getting world info: {e}")
+            logger.error("Error getting world info: %s", e)
             return None
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock("world_info_get")
 
     async def update_world_info(self, world: str, owner: str, bot: str) -> bool:
-        """Update world info with proper locking"""
-        lock = await self.acquire_lock("world_info_update")
-        if not lock:
-            raise TransactionError("System is busy, please try again later")
-
-        conn = None
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
+        """Update world info and invalidate its cache"""
+        def update(conn):
+            conn.execute("""
                 UPDATE world_info 
                 SET world = ?, owner = ?, bot = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE id = 1
             """, (world, owner, bot))
+
+        try:
+            await asyncio.to_thread(run_in_transaction, update)
             
-            conn.commit()
-            
-            # Invalidate cache
-            await self.cache_manager.delete("world_info")
+            # Force the next get_world_info to reload
+            self._world_info_expiry = 0.0
             
-            self.logger.info("World info updated")
+            logger.info("World info updated")
             return True
 
         except Exception as e:
-            self.logger.error(f"Error updating world info: {e}")
-            if conn:
-                conn.rollback()
+            logger.error("Error updating world info: %s", e)
             return False
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock("world_info_update")
 
 class ProductManagerCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.product_service = ProductManagerService(bot)
+        self.product_service = ProductManagerService.get(bot)
         self.logger = logging.getLogger("ProductManagerCog")
 
     async def cog_load(self):
@@ -1,6 +1,6 @@
 import logging
 import asyncio
-from typing import Optional, Dict, List, Union
+from typing import Optional, Dict, List, Tuple, Union
 from datetime import datetime
 
 import discord
@@ -12,31 +12,104 @@ from .constants import (
     TransactionError, # Untuk error handling
     MESSAGES        # Untuk pesan error/success
 )
-from database import get_connection
+from database import run_in_transaction
 from .base_handler import BaseLockHandler
 from .cache_manager import CacheManager
 from .product_manager import ProductManagerService
 from .balance_manager import BalanceManagerService
 
+logger = logging.getLogger(__name__)
+
+# Purchase audit rows are written after the purchase commits, in batches
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_INTERVAL = 0.1  # seconds
+
+def _amount_text(wl: int, dl: int, bgl: int, thousands: bool = False) -> str:
+    """Format an amount as 'x WL, y DL, z BGL', leaving out zero DL/BGL"""
+    spec = "," if thousands else ""
+    parts = [f"{wl:{spec}} WL"]
+    if dl > 0:
+        parts.append(f"{dl:{spec}} DL")
+    if bgl > 0:
+        parts.append(f"{bgl:{spec}} BGL")
+    return ", ".join(parts)
+
 class TransactionManager(BaseLockHandler):
     _instance = None
-    _instance_lock = asyncio.Lock()
 
     def __new__(cls, bot):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.initialized = False
+            instance = super().__new__(cls)
+            instance._setup(bot)
+            cls._instance = instance
         return cls._instance
 
     def __init__(self, bot):
-        if not self.initialized:
-            super().__init__()  # Initialize BaseLockHandler
-            self.bot = bot
-            self.logger = logging.getLogger("TransactionManager")
-            self.cache_manager = CacheManager()
-            self.product_manager = ProductManagerService(bot)
-            self.balance_manager = BalanceManagerService(bot)
-            self.initialized = True
+        # State is built exactly once in __new__; repeated construction is a no-op
+        pass
+
+    @classmethod
+    def get(cls, bot) -> "TransactionManager":
+        """Return the shared instance, skipping the constructor once it exists"""
+        return cls._instance or cls(bot)
+
+    def _setup(self, bot):
+        BaseLockHandler.__init__(self)
+        self.bot = bot
+        self.cache_manager = CacheManager()
+        self.product_manager = ProductManagerService.get(bot)
+        self.balance_manager = BalanceManagerService.get(bot)
+        self._audit_queue: asyncio.Queue = asyncio.Queue()
+        self._audit_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _insert_audit(conn, rows: List[Tuple]) -> None:
+        conn.executemany(
+            """
+            INSERT INTO transactions 
+            (growid, type, details, old_wl, old_dl, old_bgl,
+             new_wl, new_dl, new_bgl, items_count, total_price, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+
+    def _queue_audit(self, row: Tuple) -> None:
+        """Queue a transactions row for the background audit writer"""
+        if self._audit_task is None or self._audit_task.done():
+            self._audit_task = asyncio.get_running_loop().create_task(self._drain_audit())
+        self._audit_queue.put_nowait(row)
+
+    async def _drain_audit(self) -> None:
+        """Write queued audit rows with one executemany per flush interval"""
+        while True:
+            batch = [await self._audit_queue.get()]
+            await asyncio.sleep(AUDIT_FLUSH_INTERVAL)
+            while len(batch) < AUDIT_BATCH_SIZE and not self._audit_queue.empty():
+                batch.append(self._audit_queue.get_nowait())
+
+            try:
+                await asyncio.to_thread(run_in_transaction, self._insert_audit, batch)
+                # History caches are dropped once the rows are actually visible
+                await self.cache_manager.delete_many(
+                    list({f"trx_history_{row[0]}" for row in batch})
+                )
+            except Exception as e:
+                logger.error("Error writing %s purchase audit rows: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._audit_queue.task_done()
+
+    async def close(self) -> None:
+        """Flush queued audit rows and stop the audit writer"""
+        if self._audit_task and not self._audit_task.done():
+            await self._audit_queue.join()
+            self._audit_task.cancel()
+            try:
+                await self._audit_task
+            except asyncio.CancelledError:
+                pass
+        self._audit_task = None
 
     async def process_purchase(
         self, 
@@ -45,15 +118,16 @@ class TransactionManager(BaseLockHandler):
         quantity: int = 1
     ) -> Dict[str, Union[str, List[str], int]]:
         """
-        Process a purchase transaction with proper locking and validation
+        Process a purchase transaction with validation
         Returns dict with status, message, and content list if successful
+        
+        Stock claim and balance debit run in one BEGIN IMMEDIATE transaction,
+        which serializes concurrent purchases without an application lock.
         """
-        lock = await self.acquire_lock(f"purchase_{buyer_id}_{product_code}")
-        if not lock:
-            raise TransactionError("System is busy processing another transaction")
-
-        conn = None
         try:
+            if quantity <= 0:
+                raise TransactionError("Quantity must be greater than 0")
+
             # Get buyer's GrowID and verify registration
             growid = await self.balance_manager.get_growid(buyer_id)
             if not growid:
@@ -64,108 +138,105 @@ class TransactionManager(BaseLockHandler):
             if not product:
                 raise TransactionError(f"Product {product_code} not found")
 
-            # Check stock availability
-            available_stock = await self.product_manager.get_available_stock(product_code, quantity)
-            if not available_stock or len(available_stock) < quantity:
-                raise TransactionError(
-                    f"Insufficient stock! Only {len(available_stock)} available"
-                )
-
-            # Calculate total price
-            total_price = product['price'] * quantity
-
-            # Get current balance
-            balance = await self.balance_manager.get_balance(growid)
-            if not balance:
-                raise TransactionError("Could not retrieve balance")
-
-            # Convert price to WL if needed and check balance
-            total_wl = total_price
-            if total_wl > balance.total_wl():
-                raise TransactionError(
-                    f"Insufficient balance! Need {total_wl:,} WL, you have {balance.total_wl():,} WL"
-                )
-
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            try:
-                # Begin transaction
-                conn.execute("BEGIN TRANSACTION")
+            total_wl = product['price'] * quantity
+            details = f"Purchased {quantity}x {product['name']} for {total_wl:,} WL"
 
-                # Update stock status
-                stock_ids = [item['id'] for item in available_stock[:quantity]]
-                content_list = [item['content'] for item in available_stock[:quantity]]
-
-                cursor.executemany(
+            def purchase(conn) -> Tuple[List[str], Balance, Balance]:
+                # Claim stock and read its content in one statement
+                claimed = conn.execute(
                     """
                     UPDATE stock 
                     SET status = ?, buyer_id = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
+                    WHERE id IN (
+                        SELECT id FROM stock
+                        WHERE product_code = ? AND status = ?
+                        ORDER BY added_at ASC, id ASC
+                        LIMIT ?
+                    )
+                    RETURNING content
                     """,
-                    [(STATUS_SOLD, buyer_id, stock_id) for stock_id in stock_ids]
-                )
+                    (Status.SOLD, buyer_id, product['code'], Status.AVAILABLE, quantity)
+                ).fetchall()
+                if len(claimed) < quantity:
+                    raise TransactionError(
+                        f"Insufficient stock! Only {len(claimed)} available"
+                    )
 
-                # Update balance
-                new_balance = await self.balance_manager.update_balance(
-                    growid=growid,
-                    wl=-total_wl,
-                    details=f"Purchase {quantity}x {product['name']}",
-                    transaction_type=TransactionType.PURCHASE.value
-                )
+                current = conn.execute(
+                    "SELECT balance_wl, balance_dl, balance_bgl FROM users WHERE growid = ?",
+                    (growid,)
+                ).fetchone()
+                if not current:
+                    raise TransactionError(f"User {growid} not found")
+
+                old_balance = Balance(*current)
+                if total_wl > old_balance.total_wls:
+                    raise TransactionError(
+                        f"Insufficient balance! Need {total_wl:,} WL, "
+                        f"you have {old_balance.total_wls:,} WL"
+                    )
+                new_balance = Balance.from_wls(old_balance.total_wls - total_wl)
 
-                # Record transaction
-                cursor.execute(
+                conn.execute(
                     """
-                    INSERT INTO transactions 
-                    (growid, type, details, old_balance, new_balance, created_at)
-                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    UPDATE users 
+                    SET balance_wl = ?, balance_dl = ?, balance_bgl = ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE growid = ?
                     """,
-                    (
-                        growid,
-                        TransactionType.PURCHASE.value,
-                        f"Purchased {quantity}x {product['name']} for {total_wl:,} WL",
-                        balance.format(),
-                        new_balance.format()
-                    )
+                    (new_balance.wl, new_balance.dl, new_balance.bgl, growid)
                 )
+                return [row['content'] for row in claimed], old_balance, new_balance
 
-                conn.commit()
-
-                # Invalidate relevant caches
-                await self.cache_manager.delete(f"stock_count_{product_code}")
-                await self.cache_manager.delete(f"stock_{product_code}")
-                await self.cache_manager.delete(f"balance_{growid}")
-                await self.cache_manager.delete(f"trx_history_{growid}")
-
-                self.logger.info(
-                    f"Purchase successful: {growid} bought {quantity}x {product_code}"
+            try:
+                content_list, old_balance, new_balance = await asyncio.to_thread(
+                    run_in_transaction, purchase
                 )
-
-                return {
-                    'status': 'success',
-                    'message': (
-                        f"Successfully purchased {quantity}x {product['name']}\n"
-                        f"Total paid: {total_wl:,} WL\n"
-                        f"New balance: {new_balance.format()}"
-                    ),
-                    'content': content_list,
-                    'total_paid': total_wl
-                }
-
+            except TransactionError:
+                raise
             except Exception as e:
-                conn.rollback()
                 raise TransactionError(f"Transaction failed: {str(e)}")
 
+            # Audit-only row: written by the background writer so it stays out
+            # of the purchase transaction; created_at is stamped now (UTC, like
+            # CURRENT_TIMESTAMP) so the flush delay does not shift it
+            self._queue_audit((
+                growid,
+                TransactionType.PURCHASE,
+                details,
+                old_balance.wl, old_balance.dl, old_balance.bgl,
+                new_balance.wl, new_balance.dl, new_balance.bgl,
+                quantity,
+                total_wl,
+                datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            ))
+
+            # Invalidate after commit; dropping (not setting) the balance keeps
+            # a concurrent update_balance from being overwritten by a stale value
+            self.balance_manager.get_balance.cache_invalidate(growid)
+            await self.product_manager.invalidate_stock_cache(
+                product_code, extra_keys=[f"balance_{growid}"]
+            )
+            self.bot.dispatch("stock_changed", product_code)
+
+            logger.info("Purchase successful: %s bought %sx %s", growid, quantity, product_code)
+
+            return {
+                'status': 'success',
+                'message': (
+                    f"Successfully purchased {quantity}x {product['name']}\n"
+                    f"Total paid: {total_wl:,} WL\n"
+                    f"New balance: {new_balance.format()}"
+                ),
+                'content': content_list,
+                'total_paid': total_wl
+            }
+
         except TransactionError as e:
             raise
         except Exception as e:
-            self.logger.error(f"Error processing purchase: {e}")
+            logger.error("Error processing purchase: %s", e)
             raise TransactionError("An unexpected error occurred")
-        finally:
-            if conn:
-                conn.close()
-            self.release_lock(f"purchase_{buyer_id}_{product_code}")
 
     async def process_deposit(
         self, 
@@ -176,7 +247,7 @@ class TransactionManager(BaseLockHandler):
         admin_id: Optional[str] = None
     ) -> Dict[str, Union[str, Balance]]:
         """Process a deposit transaction with proper locking"""
-        lock = await self.acquire_lock(f"deposit_{user_id}")
+        lock = await self.acquire_lock(("deposit", user_id))
         if not lock:
             raise TransactionError("System is busy processing another transaction")
 
@@ -187,16 +258,12 @@ class TransactionManager(BaseLockHandler):
                 raise TransactionError("You need to register your GrowID first!")
 
             # Calculate total deposit in WL
-            total_wl = wl + (dl * 100) + (bgl * 10000)
+            total_wl = Balance(wl, dl, bgl).total_wls
             if total_wl <= 0:
                 raise TransactionError("Deposit amount must be greater than 0")
 
             # Process deposit
-            details = f"Deposit: {wl} WL"
-            if dl > 0:
-                details += f", {dl} DL"
-            if bgl > 0:
-                details += f", {bgl} BGL"
+            details = f"Deposit: {_amount_text(wl, dl, bgl)}"
             if admin_id:
                 admin_name = self.bot.get_user(int(admin_id))
                 details += f" (by {admin_name})"
@@ -207,19 +274,16 @@ class TransactionManager(BaseLockHandler):
                 dl=dl,
                 bgl=bgl,
                 details=details,
-                transaction_type=TransactionType.DEPOSIT.value
+                transaction_type=TransactionType.DEPOSIT
             )
 
-            self.logger.info(
-                f"Deposit successful: {growid} deposited {total_wl:,} WL"
-            )
+            logger.info("Deposit successful: %s deposited %s WL", growid, f"{total_wl:,}")
 
             return {
                 'status': 'success',
                 'message': (
                     f"Successfully deposited:\n"
-                    f"{wl:,} WL{f', {dl:,} DL' if dl > 0 else ''}"
-                    f"{f', {bgl:,} BGL' if bgl > 0 else ''}\n"
+                    f"{_amount_text(wl, dl, bgl, thousands=True)}\n"
                     f"New balance: {new_balance.format()}"
                 ),
                 'new_balance': new_balance
@@ -228,10 +292,10 @@ class TransactionManager(BaseLockHandler):
         except TransactionError as e:
             raise
         except Exception as e:
-            self.logger.error(f"Error processing deposit: {e}")
+            logger.error("Error processing deposit: %s", e)
             raise TransactionError("An unexpected error occurred")
         finally:
-            self.release_lock(f"deposit_{user_id}")
+            self.release_lock(("deposit", user_id))
 
     async def process_withdrawal(
         self, 
@@ -242,7 +306,7 @@ class TransactionManager(BaseLockHandler):
         admin_id: Optional[str] = None
     ) -> Dict[str, Union[str, Balance]]:
         """Process a withdrawal transaction with proper locking"""
-        lock = await self.acquire_lock(f"withdrawal_{user_id}")
+        lock = await self.acquire_lock(("withdrawal", user_id))
         if not lock:
             raise TransactionError("System is busy processing another transaction")
 
@@ -258,22 +322,18 @@ class TransactionManager(BaseLockHandler):
                 raise TransactionError("Could not retrieve balance")
 
             # Calculate total withdrawal in WL
-            total_wl = wl + (dl * 100) + (bgl * 10000)
+            total_wl = Balance(wl, dl, bgl).total_wls
             if total_wl <= 0:
                 raise TransactionError("Withdrawal amount must be greater than 0")
 
             # Check if sufficient balance
-            if total_wl > current_balance.total_wl():
+            if total_wl > current_balance.total_wls:
                 raise TransactionError(
-                    f"Insufficient balance! You have {current_balance.total_wl():,} WL"
+                    f"Insufficient balance! You have {current_balance.total_wls:,} WL"
                 )
 
             # Process withdrawal
-            details = f"Withdrawal: {wl} WL"
-            if dl > 0:
-                details += f", {dl} DL"
-            if bgl > 0:
-                details += f", {bgl} BGL"
+            details = f"Withdrawal: {_amount_text(wl, dl, bgl)}"
             if admin_id:
                 admin_name = self.bot.get_user(int(admin_id))
                 details += f" (by {admin_name})"
@@ -284,19 +344,16 @@ class TransactionManager(BaseLockHandler):
                 dl=-dl,
                 bgl=-bgl,
                 details=details,
-                transaction_type=TransactionType.WITHDRAWAL.value
+                transaction_type=TransactionType.WITHDRAW
             )
 
-            self.logger.info(
-                f"Withdrawal successful: {growid} withdrew {total_wl:,} WL"
-            )
+            logger.info("Withdrawal successful: %s withdrew %s WL", growid, f"{total_wl:,}")
 
             return {
                 'status': 'success',
                 'message': (
                     f"Successfully withdrew:\n"
-                    f"{wl:,} WL{f', {dl:,} DL' if dl > 0 else ''}"
-                    f"{f', {bgl:,} BGL' if bgl > 0 else ''}\n"
+                    f"{_amount_text(wl, dl, bgl, thousands=True)}\n"
                     f"New balance: {new_balance.format()}"
                 ),
                 'new_balance': new_balance
@@ -305,21 +362,22 @@ class TransactionManager(BaseLockHandler):
         except TransactionError as e:
             raise
         except Exception as e:
-            self.logger.error(f"Error processing withdrawal: {e}")
+            logger.error("Error processing withdrawal: %s", e)
             raise TransactionError("An unexpected error occurred")
         finally:
-            self.release_lock(f"withdrawal_{user_id}")
+            self.release_lock(("withdrawal", user_id))
 
 class TransactionCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.trx_manager = TransactionManager(bot)
+        self.trx_manager = TransactionManager.get(bot)
         self.logger = logging.getLogger("TransactionCog")
 
     async def cog_load(self):
         self.logger.info("TransactionCog loading...")
 
     async def cog_unload(self):
+        await self.trx_manager.close()
         self.logger.info("TransactionCog unloaded")
 
 async def setup(bot):
@@ -1,13 +1,11 @@
 import discord
 from discord.ext import commands
-import os
+import aiohttp
 import json
 import logging
 import asyncio
-import aiohttp
-import sqlite3
 from pathlib import Path
-from database import setup_database, get_connection
+from database import setup_database, cache_pool
 from datetime import datetime
 from utils.command_handler import AdvancedCommandHandler
 from ext.base_handler import BaseLockHandler, BaseResponseHandler
@@ -28,6 +26,13 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Parser JSON sama dengan CacheManager: orjson jika terpasang
+try:
+    import orjson
+    _load_json = orjson.loads
+except ImportError:
+    _load_json = json.loads
+
 # Load config dengan validasi
 def load_config():
     required_keys = {
@@ -46,8 +51,8 @@ def load_config():
     }
     
     try:
-        with open('config.json', 'r') as config_file:
-            config = json.load(config_file)
+        with open('config.json', 'rb') as config_file:
+            config = _load_json(config_file.read())
 
         # Validate and convert types
         for key, expected_type in required_keys.items():
@@ -62,6 +67,11 @@ def load_config():
                 if not isinstance(config[key], expected_type):
                     config[key] = expected_type(config[key])
 
+        # ID channel di-cast ke int sekali di sini, bukan di setiap pemakaian
+        config['channels'] = {
+            name: int(channel_id) for name, channel_id in config['channels'].items()
+        }
+
         return config
 
     except FileNotFoundError:
@@ -84,10 +94,16 @@ LOG_PURCHASE_CHANNEL_ID = int(config['id_log_purch'])
 DONATION_LOG_CHANNEL_ID = int(config['id_donation_log'])
 HISTORY_BUY_CHANNEL_ID = int(config['id_history_buy'])
 
+# Dibuat sekali, dipakai ulang setiap reconnect
+INTENTS = discord.Intents.all()
+PRESENCE_ACTIVITY = discord.Activity(
+    type=discord.ActivityType.watching,
+    name="Growtopia Shop | !help"
+)
+
 class MyBot(commands.Bot, BaseLockHandler, BaseResponseHandler):
     def __init__(self):
-        intents = discord.Intents.all()
-        commands.Bot.__init__(self, command_prefix='!', intents=intents, help_command=commands.DefaultHelpCommand())
+        commands.Bot.__init__(self, command_prefix='!', intents=INTENTS, help_command=commands.DefaultHelpCommand())
         BaseLockHandler.__init__(self)
         
         self.session = None
@@ -97,11 +113,26 @@ class MyBot(commands.Bot, BaseLockHandler, BaseResponseHandler):
         self.log_purchase_channel_id = LOG_PURCHASE_CHANNEL_ID
         self.donation_log_channel_id = DONATION_LOG_CHANNEL_ID
         self.history_buy_channel_id = HISTORY_BUY_CHANNEL_ID
+        # Channel yang pesannya dicatat di on_message
+        self._logged_channels = frozenset((
+            self.live_stock_channel_id,
+            self.log_purchase_channel_id,
+            self.donation_log_channel_id,
+            self.history_buy_channel_id
+        ))
         self.config = config
         self.startup_time = datetime.utcnow()
         self.command_handler = AdvancedCommandHandler(self)
         self.cache_manager = CacheManager()
 
+        # Tabel handler error per tipe; None = diabaikan
+        self._error_handlers = {
+            commands.errors.CheckFailure: self._handle_check_failure,
+            commands.errors.CommandNotFound: None,
+            commands.errors.MissingRequiredArgument: self._handle_missing_argument,
+            commands.errors.BadArgument: self._handle_bad_argument,
+        }
+
     async def setup_hook(self):
         """Initialize bot components"""
         self.session = aiohttp.ClientSession()
@@ -127,26 +158,38 @@ class MyBot(commands.Bot, BaseLockHandler, BaseResponseHandler):
             'cogs.leveling',
         ]
         
-        loaded_extensions = set()
+        # Load concurrently; one failing extension does not stop the others
+        results = await asyncio.gather(
+            *(self.load_extension(ext) for ext in extensions),
+            return_exceptions=True
+        )
         
-        for ext in extensions:
-            try:
-                if ext not in loaded_extensions:
-                    await self.load_extension(ext)
-                    loaded_extensions.add(ext)
-                    logger.info(f'✅ Loaded extension: {ext}')
-            except Exception as e:
-                logger.error(f'❌ Failed to load {ext}: {e}')
-                logger.exception(f"Detailed error loading {ext}:")
-                continue
+        for ext, result in zip(extensions, results):
+            if isinstance(result, Exception):
+                logger.error(f'❌ Failed to load {ext}: {result}')
+                logger.error(f"Detailed error loading {ext}:", exc_info=result)
+            else:
+                logger.info(f'✅ Loaded extension: {ext}')
 
     async def close(self):
         """Cleanup when bot shuts down"""
         logger.info("Bot shutting down...")
         
+        # Kirim sisa log command selagi koneksi Discord masih terbuka;
+        # analytics yang di-flush hanya masuk buffer cache (belum ditutup)
+        try:
+            await self.command_handler.close()
+        except Exception as e:
+            logger.error(f"Error flushing command logs: {e}")
+
+        # Unload extension sebelum cache dan database ditutup: cog_unload
+        # masih menulis ke keduanya (mis. audit transaksi yang tersisa)
+        await super().close()
+
         # Cleanup cache
         try:
             await self.cache_manager.cleanup()
+            await self.cache_manager.close()
             logger.info("Cache cleaned up successfully")
         except Exception as e:
             logger.error(f"Error cleaning up cache: {e}")
@@ -155,8 +198,9 @@ class MyBot(commands.Bot, BaseLockHandler, BaseResponseHandler):
         if self.session:
             await self.session.close()
             logger.info("Session closed")
-            
-        await super().close()
+
+        # Close pooled database connections paling akhir
+        cache_pool.close()
 
     async def on_ready(self):
         """Event when bot is ready"""
@@ -176,8 +220,8 @@ class MyBot(commands.Bot, BaseLockHandler, BaseResponseHandler):
             'Purchase Log': self.log_purchase_channel_id,
             'Donation Log': self.donation_log_channel_id,
             'History Buy': self.history_buy_channel_id,
-            'Music': int(self.config['channels'].get('music', 0)),
-            'Logs': int(self.config['channels'].get('logs', 0))
+            'Music': self.config['channels'].get('music', 0),
+            'Logs': self.config['channels'].get('logs', 0)
         }
 
         for name, channel_id in channels.items():
@@ -193,10 +237,7 @@ class MyBot(commands.Bot, BaseLockHandler, BaseResponseHandler):
 
         # Set custom status
         await self.change_presence(
-            activity=discord.Activity(
-                type=discord.ActivityType.watching,
-                name="Growtopia Shop | !help"
-            ),
+            activity=PRESENCE_ACTIVITY,
             status=discord.Status.online
         )
         
@@ -210,15 +251,10 @@ class MyBot(commands.Bot, BaseLockHandler, BaseResponseHandler):
             return
 
         # Log messages from specific channels
-        if message.channel.id in [
-            self.live_stock_channel_id,
-            self.log_purchase_channel_id,
-            self.donation_log_channel_id,
-            self.history_buy_channel_id
-        ]:
+        if message.channel.id in self._logged_channels and logger.isEnabledFor(logging.INFO):
             logger.info(
-                f'Channel {message.channel.name}: '
-                f'{message.author}: {message.content}'
+                'Channel %s: %s: %s',
+                message.channel.name, message.author, message.content
             )
 
         await self.process_commands(message)
@@ -236,40 +272,57 @@ class MyBot(commands.Bot, BaseLockHandler, BaseResponseHandler):
         
     async def on_command_error(self, ctx, error):
         """Global error handler"""
-        if isinstance(error, commands.errors.CheckFailure):
-            await self.send_response_once(
-                ctx, 
-                "❌ You don't have permission to use this command!", 
-                delete_after=5
-            )
-        elif isinstance(error, commands.errors.CommandNotFound):
-            pass  # Ignore command not found
-        elif isinstance(error, commands.errors.MissingRequiredArgument):
-            await self.send_response_once(
-                ctx,
-                f"❌ Missing required argument: {error.param.name}",
-                delete_after=5
-            )
-        elif isinstance(error, commands.errors.BadArgument):
-            await self.send_response_once(
-                ctx,
-                "❌ Invalid argument provided!",
-                delete_after=5
-            )
+        # Cari handler lewat MRO supaya subclass (mis. MissingRole -> CheckFailure) ikut tertangkap
+        handlers = self._error_handlers
+        for error_type in type(error).__mro__:
+            if error_type in handlers:
+                handler = handlers[error_type]
+                break
         else:
-            error_msg = f'Error in command {ctx.command}: {error}'
-            logger.error(error_msg)
-            await self.send_response_once(
-                ctx,
-                "❌ An error occurred! The administrator has been notified.",
-                delete_after=5
-            )
-            
-            # Notify admin if serious error
-            if not isinstance(error, (commands.errors.CheckFailure, commands.errors.CommandNotFound)):
-                admin = self.get_user(self.admin_id)
-                if admin:
-                    await admin.send(f"⚠️ Bot Error:\n```{error_msg}```")
+            handler = self._handle_unexpected_error
+
+        if handler is not None:
+            await handler(ctx, error)
+
+    async def _handle_check_failure(self, ctx, error):
+        await self.send_response_once(
+            ctx, 
+            "❌ You don't have permission to use this command!", 
+            delete_after=5
+        )
+
+    async def _handle_missing_argument(self, ctx, error):
+        await self.send_response_once(
+            ctx,
+            f"❌ Missing required argument: {error.param.name}",
+            delete_after=5
+        )
+
+    async def _handle_bad_argument(self, ctx, error):
+        await self.send_response_once(
+            ctx,
+            "❌ Invalid argument provided!",
+            delete_after=5
+        )
+
+    async def _handle_unexpected_error(self, ctx, error):
+        error_msg = f'Error in command {ctx.command}: {error}'
+        logger.error(error_msg)
+        await self.send_response_once(
+            ctx,
+            "❌ An error occurred! The administrator has been notified.",
+            delete_after=5
+        )
+
+        # Notify admin
+        admin = self.get_user(self.admin_id)
+        if admin:
+            await admin.send(f"⚠️ Bot Error:\n```{error_msg}```")
+
+    async def on_guild_channel_delete(self, channel):
+        """Lepas referensi channel log yang di-cache jika channelnya dihapus"""
+        if channel.id == self.command_handler.log_channel_id:
+            self.command_handler.log_channel = None
 
     async def on_guild_join(self, guild):
         """Event when bot joins a new guild"""
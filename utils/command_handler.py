@@ -1,81 +1,195 @@
 import discord
 from discord.ext import commands
+import asyncio
 import logging
-import json
+import hashlib
+import math
+import struct
+import time
+import traceback
+from array import array
+from collections import deque
 from datetime import datetime
-from typing import Optional, Dict, List, Tuple, Any
+from typing import Optional, Dict, List, Set, Tuple, Any
 from ext.cache_manager import CacheManager
 
 logger = logging.getLogger(__name__)
 
+# Sketch unique user/channel: bitmap tetap (linear counting), bukan set yang terus tumbuh
+_SKETCH_BITS = 4096
+# Interval minimum (detik) antar simpan statistik ke cache permanen per command
+ANALYTICS_PERSIST_INTERVAL = 60
+# Jumlah error terakhir yang disimpan per command
+ERROR_HISTORY_SIZE = 50
+# Jumlah frame traceback maksimal per error yang disimpan
+TRACEBACK_LIMIT = 10
+# Pemakaian per jam: 24 counter uint32, disimpan sebagai blob 96 byte (hex)
+_PEAK_TIMES = struct.Struct('<24I')
+# Log command dikirim berkelompok: maksimal 10 embed per pesan (batas Discord)
+LOG_BATCH_SIZE = 10
+LOG_FLUSH_INTERVAL = 1.0
+LOG_QUEUE_SIZE = 512
+LOG_BATCH_CHARS = 6000
+# Template embed log command; warna diindeks dengan success (merah, hijau)
+_LOG_TEMPLATE = (
+    "**Command:** `{command}`\n"
+    "**User:** {user} (`{user_id}`)\n"
+    "**Channel:** {channel} (`{channel_id}`)"
+    "{guild}{error}{args}"
+)
+_LOG_COLORS = (0xE74C3C, 0x2ECC71)
+# Panjang maksimal blok error/argumen agar embed tidak melewati batas Discord
+_LOG_BLOCK_LIMIT = 1000
+# Interval (detik) bersih-bersih window rate limit yang sudah kosong
+RATE_WINDOW_SWEEP_INTERVAL = 300
+
+def _sketch_add(sketch: bytearray, value: int) -> None:
+    """Tandai value di bitmap sketch"""
+    # blake2b mengacak bit snowflake yang berurutan secara merata
+    digest = hashlib.blake2b(value.to_bytes(8, 'little'), digest_size=4).digest()
+    bit = int.from_bytes(digest, 'little') % _SKETCH_BITS
+    sketch[bit >> 3] |= 1 << (bit & 7)
+
+def sketch_estimate(sketch: bytearray) -> int:
+    """Perkiraan jumlah value unik di sketch (linear counting)"""
+    zeros = _SKETCH_BITS - int.from_bytes(sketch, 'little').bit_count()
+    if zeros == 0:
+        return _SKETCH_BITS  # Sketch penuh, hanya batas bawah
+    return round(-_SKETCH_BITS * math.log(zeros / _SKETCH_BITS))
+
+# Pesan error untuk user per tipe exception
+_ERROR_MESSAGES = {
+    commands.MissingPermissions: lambda e: "❌ You don't have the required permissions!",
+    commands.CommandOnCooldown: lambda e: f"⏰ Please wait {e.retry_after:.1f}s before using this command again!",
+    commands.MissingRequiredArgument: lambda e: f"❌ Missing required argument: {e.param.name}",
+    commands.BadArgument: lambda e: "❌ Invalid argument provided!",
+}
+
 class CommandAnalytics:
     def __init__(self):
         self.cache_manager = CacheManager()
         self._command_registry = {}  # Track registered commands
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._persisted_at: Dict[str, float] = {}
+        # Command dengan update yang belum tersimpan ke cache permanen
+        self._dirty: Set[str] = set()
+        self._errors: Dict[str, deque] = {}
 
-    async def track_command(self, ctx: commands.Context, command: str) -> None:
-        """Track command usage dengan sistem registry yang lebih baik"""
-        cache_key = f"analytics:command:{command}"
-        
-        # Get atau create stats dari cache
-        stats = await self.cache_manager.get(cache_key) or {
+    @staticmethod
+    def _new_stats() -> Dict[str, Any]:
+        return {
             'total_uses': 0,
-            'unique_users': set(),
-            'unique_channels': set(),
-            'usage_history': [],
-            'peak_times': [0] * 24,
+            'unique_users': bytearray(_SKETCH_BITS // 8),
+            'unique_channels': bytearray(_SKETCH_BITS // 8),
+            'usage_history': deque(maxlen=100),
+            'peak_times': array('I', bytes(_PEAK_TIMES.size)),
             'last_used': None,
             'success_rate': {'success': 0, 'failed': 0}
         }
 
-        # Convert sets dari cache jika perlu
-        if isinstance(stats['unique_users'], list):
-            stats['unique_users'] = set(stats['unique_users'])
-        if isinstance(stats['unique_channels'], list):
-            stats['unique_channels'] = set(stats['unique_channels'])
+    async def _load_stats(self, command: str) -> Dict[str, Any]:
+        """Ambil statistik dari cache sekali, lalu disimpan di memory"""
+        stats = self._new_stats()
+        cached = await self.cache_manager.get(f"analytics:command:{command}")
+        if isinstance(cached, dict):
+            stats['total_uses'] = cached.get('total_uses', 0)
+            peak_times = cached.get('peak_times')
+            if isinstance(peak_times, str):
+                stats['peak_times'] = array('I', _PEAK_TIMES.unpack(bytes.fromhex(peak_times)))
+            elif isinstance(peak_times, list) and len(peak_times) == 24:
+                stats['peak_times'] = array('I', peak_times)
+            stats['last_used'] = cached.get('last_used')
+            stats['success_rate'] = cached.get('success_rate') or stats['success_rate']
+            stats['usage_history'].extend(cached.get('usage_history') or [])
+            for field in ('unique_users', 'unique_channels'):
+                # Format lama menyimpan list ID; format baru hex bitmap
+                value = cached.get(field)
+                if isinstance(value, str):
+                    stats[field] = bytearray.fromhex(value)
+                elif isinstance(value, list):
+                    for item in value:
+                        _sketch_add(stats[field], int(item))
+        # Pemanggil lain mungkin sudah memuat selama await di atas
+        return self._stats.setdefault(command, stats)
+
+    async def _persist_stats(self, command: str, stats: Dict[str, Any]) -> None:
+        await self.cache_manager.set(
+            f"analytics:command:{command}",
+            {
+                **stats,
+                'unique_users': stats['unique_users'].hex(),
+                'unique_channels': stats['unique_channels'].hex(),
+                'peak_times': _PEAK_TIMES.pack(*stats['peak_times']).hex(),
+                'usage_history': list(stats['usage_history'])
+            },
+            expires_in=3600,  # 1 hour cache
+            permanent=True
+        )
+
+    async def track_command(self, ctx: commands.Context, command: str) -> None:
+        """
+        Track command usage dengan counter in-memory
+        
+        Update dilakukan in-place tanpa await di tengahnya, jadi tidak ada
+        race read-modify-write; memory per command tetap (bitmap + 24 jam
+        + 100 history). Snapshot disimpan ke cache permanen paling sering
+        sekali per ANALYTICS_PERSIST_INTERVAL.
+        """
+        stats = self._stats.get(command)
+        if stats is None:
+            stats = await self._load_stats(command)
 
         # Update statistik
+        # datetime hanya untuk string yang dibaca manusia, diformat sekali
         now = datetime.utcnow()
+        now_iso = now.isoformat()
         stats['total_uses'] += 1
-        stats['unique_users'].add(ctx.author.id)
-        stats['unique_channels'].add(ctx.channel.id)
-        stats['last_used'] = now.isoformat()
+        _sketch_add(stats['unique_users'], ctx.author.id)
+        _sketch_add(stats['unique_channels'], ctx.channel.id)
+        stats['last_used'] = now_iso
         stats['peak_times'][now.hour] += 1
 
-        # Tracking history dengan limit
+        # Tracking history dengan limit (deque membuang entry terlama)
         stats['usage_history'].append({
-            'timestamp': now.isoformat(),
+            'timestamp': now_iso,
             'user_id': ctx.author.id,
             'channel_id': ctx.channel.id
         })
-        
-        # Keep only last 100 entries
-        if len(stats['usage_history']) > 100:
-            stats['usage_history'] = stats['usage_history'][-100:]
 
-        # Prepare untuk cache (convert sets ke lists)
-        cache_stats = stats.copy()
-        cache_stats['unique_users'] = list(stats['unique_users'])
-        cache_stats['unique_channels'] = list(stats['unique_channels'])
+        mono = time.monotonic()
+        if mono - self._persisted_at.get(command, 0.0) >= ANALYTICS_PERSIST_INTERVAL:
+            self._persisted_at[command] = mono
+            self._dirty.discard(command)
+            await self._persist_stats(command, stats)
+        else:
+            self._dirty.add(command)
 
-        # Cache dengan TTL dan backup permanen
-        await self.cache_manager.set(
-            cache_key,
-            cache_stats,
-            expires_in=3600,  # 1 hour cache
-            permanent=True
-        )
+    async def flush(self) -> None:
+        """Simpan statistik yang belum tersimpan, dipanggil saat shutdown"""
+        dirty, self._dirty = self._dirty, set()
+        for command in dirty:
+            await self._persist_stats(command, self._stats[command])
 
     async def track_error(self, command: str, error: Exception, ctx: Optional[commands.Context] = None) -> None:
         """Track error dengan context yang lebih lengkap"""
         cache_key = f"analytics:errors:{command}"
-        errors = await self.cache_manager.get(cache_key) or []
+        errors = self._errors.get(command)
+        if errors is None:
+            cached = await self.cache_manager.get(cache_key)
+            # Keep only last 50 errors; deque membuang entry terlama tanpa copy list
+            errors = self._errors.setdefault(
+                command,
+                deque(cached if isinstance(cached, list) else (), maxlen=ERROR_HISTORY_SIZE)
+            )
         
         error_data = {
             'timestamp': datetime.utcnow().isoformat(),
             'error_type': type(error).__name__,
             'error_message': str(error),
-            'traceback': getattr(error, '__traceback__', None).__str__(),
+            'traceback': (
+                ''.join(traceback.format_exception(type(error), error, error.__traceback__, limit=TRACEBACK_LIMIT))
+                if error.__traceback__ else None
+            ),
             'context': {
                 'user_id': ctx.author.id if ctx else None,
                 'channel_id': ctx.channel.id if ctx else None,
@@ -84,14 +198,10 @@ class CommandAnalytics:
         }
         
         errors.append(error_data)
-        
-        # Keep only last 50 errors to prevent overflow
-        if len(errors) > 50:
-            errors = errors[-50:]
             
         await self.cache_manager.set(
             cache_key,
-            errors,
+            list(errors),
             expires_in=86400,  # 24 hours cache
             permanent=True
         )
@@ -102,21 +212,82 @@ class AdvancedCommandHandler:
         self.analytics = CommandAnalytics()
         self.cache_manager = CacheManager()
         
-        # Load config dengan error handling yang lebih baik
-        try:
-            with open('config.json', 'r') as f:
-                self.config = json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading config: {e}")
-            self.config = self._get_default_config()
+        # Pakai config yang sudah dimuat dan divalidasi main.py
+        self.config = getattr(bot, 'config', None) or self._get_default_config()
+        # ID admin di-cast sekali, dibandingkan sebagai int di setiap check
+        self._admin_id = int(self.config.get('admin_id') or 0)
             
         # Setup sistem rate limiting dan cooldown
         self.rate_limits = self._setup_rate_limits()
+        self._rate_windows: Dict[str, deque] = {}
+        self._max_rate_window = max(window for _, window in self.rate_limits.values())
+        self._rate_swept_at = time.monotonic()
         self.cooldowns = self._setup_cooldowns()
         self.permissions = self._setup_permissions()
+        self._all_perm_roles, self._command_roles = self._build_command_roles(
+            self._resolve_permission_roles(self.permissions)
+        )
         
         # Setup channel untuk logging
-        self.log_channel_id = int(self.config.get('channels', {}).get('logs', 0))
+        # ID channel sudah di-cast ke int oleh load_config
+        self.log_channel_id = self.config.get('channels', {}).get('logs', 0)
+        # Objek channel log, di-resolve sekali saat pertama dipakai
+        self.log_channel = None
+
+        # Fitur yang mati tidak dipanggil sama sekali dari handle_command
+        self._logging_enabled = bool(self.log_channel_id)
+        self._analytics_enabled = bool(self.config.get('analytics', True))
+
+        # Embed log diantrikan dan dikirim oleh satu task di background
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._log_task: Optional[asyncio.Task] = None
+
+    def _queue_log(self, embed: Any) -> None:
+        """Antrikan embed log untuk dikirim oleh log sender"""
+        if self._log_task is None or self._log_task.done():
+            self._log_task = asyncio.get_running_loop().create_task(self._drain_logs())
+        try:
+            self._log_queue.put_nowait(embed)
+        except asyncio.QueueFull:
+            logger.warning("Command log queue full, dropping log entry")
+
+    async def _drain_logs(self) -> None:
+        """Kirim embed yang terkumpul dalam satu pesan per flush interval"""
+        carry = None
+        while True:
+            batch = [carry if carry is not None else await self._log_queue.get()]
+            carry = None
+            size = len(batch[0])
+            await asyncio.sleep(LOG_FLUSH_INTERVAL)
+            while len(batch) < LOG_BATCH_SIZE and not self._log_queue.empty():
+                embed = self._log_queue.get_nowait()
+                # Total karakter semua embed dalam satu pesan dibatasi Discord
+                if size + len(embed) > LOG_BATCH_CHARS:
+                    carry = embed
+                    break
+                batch.append(embed)
+                size += len(embed)
+
+            try:
+                if self.log_channel is not None:
+                    await self.log_channel.send(embeds=batch)
+            except Exception as e:
+                logger.error(f"Failed to send {len(batch)} command logs: {e}")
+            finally:
+                for _ in batch:
+                    self._log_queue.task_done()
+
+    async def close(self) -> None:
+        """Simpan sisa analytics, kirim sisa log di antrian lalu hentikan log sender"""
+        await self.analytics.flush()
+        if self._log_task and not self._log_task.done():
+            await self._log_queue.join()
+            self._log_task.cancel()
+            try:
+                await self._log_task
+            except asyncio.CancelledError:
+                pass
+        self._log_task = None
 
     def _get_default_config(self) -> Dict:
         """Default configuration jika config.json bermasalah"""
@@ -156,149 +327,167 @@ class AdvancedCommandHandler:
         """Setup permissions dengan validation"""
         return self.config.get('permissions', {})
 
-    async def check_rate_limit(self, ctx: commands.Context) -> bool:
-        """Rate limit check dengan better caching"""
-        now = datetime.utcnow()
+    def _resolve_permission_roles(self, permissions: Dict) -> Dict[int, List[str]]:
+        """
+        Ubah key section permissions menjadi role_id (int)
+
+        Key boleh berupa role ID langsung atau nama role yang dipetakan lewat
+        config['roles']. Key yang tidak bisa di-resolve dilewati dengan warning.
+        """
+        role_names = self.config.get('roles', {})
+        resolved: Dict[int, List[str]] = {}
+        for key, perms in permissions.items():
+            role_id = str(role_names.get(key, key))
+            if not role_id.isdigit():
+                logger.warning(f"Permission role '{key}' tidak ditemukan di config roles, dilewati")
+                continue
+            # Beberapa nama bisa menunjuk role yang sama; permission-nya digabung
+            resolved.setdefault(int(role_id), []).extend(perms)
+        return resolved
+
+    @staticmethod
+    def _build_command_roles(role_perms: Dict[int, List[str]]) -> Tuple[frozenset, Dict[str, frozenset]]:
+        """
+        Index terbalik permission: command -> frozenset role_id (int) yang boleh
         
-        # Admin bypass
-        if str(ctx.author.id) == str(self.config.get('admin_id')):
-            return True
+        role_perms adalah hasil _resolve_permission_roles (key sudah int).
+        Role dengan 'all' dikembalikan terpisah dan sudah digabung ke setiap
+        command, sehingga command yang tidak terdaftar cukup memakai set itu.
+        """
+        all_roles = frozenset(
+            role_id for role_id, perms in role_perms.items() if 'all' in perms
+        )
+        command_roles: Dict[str, set] = {}
+        for role_id, perms in role_perms.items():
+            for command in perms:
+                if command != 'all':
+                    command_roles.setdefault(command, set()).add(role_id)
+        return all_roles, {
+            command: frozenset(roles) | all_roles
+            for command, roles in command_roles.items()
+        }
 
-        # Multi-level rate limiting
-        cache_keys = {
+    @staticmethod
+    def _rate_limit_keys(ctx: commands.Context) -> Dict[str, str]:
+        return {
             'user': f"rate_limit:user:{ctx.author.id}",
             'channel': f"rate_limit:channel:{ctx.channel.id}",
             'global': "rate_limit:global"
         }
+
+    async def check_rate_limit(self, ctx: commands.Context) -> bool:
+        """
+        Rate limit sliding window per level (user, channel, global)
         
-        for limit_type, cache_key in cache_keys.items():
-            rate_data = await self.cache_manager.get(cache_key) or {
-                'commands': [],
-                'last_reset': now.timestamp()
-            }
-            
-            # Cleanup old commands
-            window = self.rate_limits[limit_type][1]
-            rate_data['commands'] = [
-                cmd_time for cmd_time in rate_data['commands']
-                if (now - datetime.fromtimestamp(cmd_time)).total_seconds() <= window
-            ]
-            
-            # Check limit
-            if len(rate_data['commands']) >= self.rate_limits[limit_type][0]:
+        Timestamp disimpan di deque in-process yang urut waktu, jadi entry
+        kadaluarsa cukup dibuang dari kiri. Cek dan catat terjadi tanpa await
+        di antaranya sehingga dua command bersamaan tidak bisa lolos dengan
+        state lama.
+        """
+        # Admin bypass
+        if ctx.author.id == self._admin_id:
+            return True
+
+        now = time.monotonic()
+        self._sweep_rate_windows(now)
+
+        windows = []
+        for limit_type, key in self._rate_limit_keys(ctx).items():
+            limit, window = self.rate_limits[limit_type]
+            stamps = self._rate_windows.get(key)
+            if stamps is None:
+                stamps = self._rate_windows[key] = deque()
+
+            # Buang command di luar window
+            cutoff = now - window
+            while stamps and stamps[0] < cutoff:
+                stamps.popleft()
+
+            if len(stamps) >= limit:
                 return False
-                
-            # Update rate limit data
-            rate_data['commands'].append(now.timestamp())
-            await self.cache_manager.set(
-                cache_key,
-                rate_data,
-                expires_in=window
-            )
-            
+            windows.append(stamps)
+
+        # Semua level lolos: baru dicatat, command yang ditolak tidak makan kuota
+        for stamps in windows:
+            stamps.append(now)
         return True
 
+    def _sweep_rate_windows(self, now: float) -> None:
+        """Hapus window yang sudah tidak punya command aktif, maksimal sekali per interval"""
+        if now - self._rate_swept_at < RATE_WINDOW_SWEEP_INTERVAL:
+            return
+        self._rate_swept_at = now
+        cutoff = now - self._max_rate_window
+        stale = [key for key, stamps in self._rate_windows.items() if not stamps or stamps[-1] < cutoff]
+        for key in stale:
+            del self._rate_windows[key]
+
     async def check_cooldown(self, user_id: int, command: str) -> Tuple[bool, float]:
-        """Cooldown check dengan better caching"""
+        """
+        Cooldown check atomik lewat CacheManager.set_nx
+        
+        Key cooldown hanya ada di memory cache; jika set_nx gagal berarti
+        cooldown masih berjalan dan sisanya diambil dari TTL entry.
+        """
         # Admin bypass
-        if str(user_id) == str(self.config.get('admin_id')):
+        if user_id == self._admin_id:
             return True, 0
 
         cache_key = f"cooldown:{user_id}:{command}"
-        last_used = await self.cache_manager.get(cache_key)
-        
-        if last_used:
-            cooldown_time = self.cooldowns.get(command, self.cooldowns.get('default', 3))
-            elapsed = (datetime.utcnow() - datetime.fromtimestamp(last_used)).total_seconds()
-            
-            if elapsed < cooldown_time:
-                return False, cooldown_time - elapsed
-
-        # Set new cooldown
-        await self.cache_manager.set(
-            cache_key,
-            datetime.utcnow().timestamp(),
-            expires_in=self.cooldowns.get(command, 3)
-        )
-        return True, 0
+        cooldown_time = self.cooldowns.get(command, self.cooldowns.get('default', 3))
+        if self.cache_manager.set_nx(cache_key, 1, cooldown_time):
+            return True, 0
+        return False, self.cache_manager.ttl(cache_key)
 
     async def check_permissions(self, ctx: commands.Context, command: str) -> bool:
-        """Permission check dengan better caching"""
+        """Permission check lewat index role per command yang sudah dihitung di awal"""
         # Admin bypass
-        if str(ctx.author.id) == str(self.config.get('admin_id')):
+        if ctx.author.id == self._admin_id:
             return True
-            
-        cache_key = f"perms:{ctx.author.id}:{command}"
-        cached_perm = await self.cache_manager.get(cache_key)
-        
-        if cached_perm is not None:
-            return cached_perm
 
-        # Check user roles
-        user_roles = [str(role.id) for role in ctx.author.roles]
-        has_permission = False
-        
-        for role_id in user_roles:
-            if role_id in self.permissions:
-                perms = self.permissions[role_id]
-                if 'all' in perms or command in perms:
-                    has_permission = True
-                    break
-
-        # Cache result
-        await self.cache_manager.set(
-            cache_key,
-            has_permission,
-            expires_in=300  # 5 minutes cache
-        )
-        
-        return has_permission
+        allowed = self._command_roles.get(command, self._all_perm_roles)
+        return not allowed.isdisjoint(role.id for role in ctx.author.roles)
 
     async def log_command(self, ctx: commands.Context, command: str, success: bool, error: Optional[Exception] = None) -> None:
         """Log command dengan better formatting dan error handling"""
         if not self.log_channel_id:
             return
             
-        channel = self.bot.get_channel(self.log_channel_id)
-        if not channel:
-            return
+        channel = self.log_channel
+        if channel is None:
+            channel = self.log_channel = self.bot.get_channel(self.log_channel_id)
+            if channel is None:
+                return
 
-        # Create detailed embed
+        # Satu timestamp untuk embed dan entry cache
+        now = datetime.utcnow()
+
+        # Embed satu description dari template tetap, bukan field per baris
+        args = ctx.args[2:] if ctx.args and len(ctx.args) > 2 else []  # Skip bot and ctx
+        description = _LOG_TEMPLATE.format(
+            command=command,
+            user=ctx.author,
+            user_id=ctx.author.id,
+            channel=ctx.channel,
+            channel_id=ctx.channel.id,
+            guild=f"\n**Guild:** {ctx.guild.name} (`{ctx.guild.id}`)" if ctx.guild else "",
+            error=(
+                f"\n**Error:**```py\n{type(error).__name__}: {error}"[:_LOG_BLOCK_LIMIT] + "```"
+                if error else ""
+            ),
+            args=(
+                f"\n**Arguments:**```py\n{', '.join(map(str, args))}"[:_LOG_BLOCK_LIMIT] + "```"
+                if args else ""
+            )
+        )
         embed = discord.Embed(
             title="Command Log",
-            timestamp=datetime.utcnow(),
-            color=discord.Color.green() if success else discord.Color.red()
+            description=description,
+            timestamp=now,
+            color=_LOG_COLORS[success]
         )
-        
-        # Basic info
-        embed.add_field(name="Command", value=f"`{command}`", inline=True)
-        embed.add_field(name="User", value=f"{ctx.author} (`{ctx.author.id}`)", inline=True)
-        embed.add_field(name="Channel", value=f"{ctx.channel} (`{ctx.channel.id}`)", inline=True)
-        
-        # Additional info
-        if hasattr(ctx, 'guild') and ctx.guild:
-            embed.add_field(name="Guild", value=f"{ctx.guild.name} (`{ctx.guild.id}`)", inline=True)
-            
-        if error:
-            embed.add_field(
-                name="Error",
-                value=f"```py\n{type(error).__name__}: {str(error)}```",
-                inline=False
-            )
-            
-        # Add command arguments if any
-        if ctx.args and len(ctx.args) > 2:  # First 2 args are bot and ctx
-            args = ctx.args[2:]  # Skip bot and ctx
-            embed.add_field(
-                name="Arguments",
-                value=f"```py\n{', '.join(map(str, args))}```",
-                inline=False
-            )
 
-        try:
-            await channel.send(embed=embed)
-        except Exception as e:
-            logger.error(f"Failed to send command log: {e}")
+        self._queue_log(embed)
 
         # Cache log entry
         cache_key = f"cmdlog:{ctx.message.id}"
@@ -309,16 +498,19 @@ class AdvancedCommandHandler:
             'guild_id': ctx.guild.id if ctx.guild else None,
             'success': success,
             'error': str(error) if error else None,
-            'args': ctx.args[2:] if ctx.args and len(ctx.args) > 2 else [],
-            'timestamp': datetime.utcnow().isoformat()
+            'args': args,
+            'timestamp': now.isoformat()
         }
         
-        await self.cache_manager.set(
-            cache_key,
-            log_entry,
-            expires_in=86400,  # 24 hours
-            permanent=True
-        )
+        try:
+            # Cukup di memory cache (LRU terbatas); tidak perlu satu baris DB per command
+            await self.cache_manager.set(
+                cache_key,
+                log_entry,
+                expires_in=86400  # 24 hours
+            )
+        except Exception as e:
+            logger.error(f"Failed to cache command log: {e}")
 
     async def handle_command(self, ctx: commands.Context, command_name: str) -> None:
         """Handle command dengan better error handling dan logging"""
@@ -349,27 +541,27 @@ class AdvancedCommandHandler:
                 return
                 
             # Track command usage
-            await self.analytics.track_command(ctx, command_name)
+            if self._analytics_enabled:
+                await self.analytics.track_command(ctx, command_name)
             
-            # Log successful execution
-            await self.log_command(ctx, command_name, True)
+            # Log successful execution (embed dikirim berkelompok di background)
+            if self._logging_enabled:
+                await self.log_command(ctx, command_name, True)
             
         except Exception as e:
             # Error tracking dengan context
-            await self.analytics.track_error(command_name, e, ctx)
-            await self.log_command(ctx, command_name, False, e)
+            if self._analytics_enabled:
+                await self.analytics.track_error(command_name, e, ctx)
+            if self._logging_enabled:
+                await self.log_command(ctx, command_name, False, e)
             
-            # Custom error messages
+            # Custom error messages lewat tabel; MRO supaya subclass ikut tertangkap
             error_message = "❌ An error occurred while executing the command!"
-            
-            if isinstance(e, commands.MissingPermissions):
-                error_message = "❌ You don't have the required permissions!"
-            elif isinstance(e, commands.CommandOnCooldown):
-                error_message = f"⏰ Please wait {e.retry_after:.1f}s before using this command again!"
-            elif isinstance(e, commands.MissingRequiredArgument):
-                error_message = f"❌ Missing required argument: {e.param.name}"
-            elif isinstance(e, commands.BadArgument):
-                error_message = "❌ Invalid argument provided!"
+            for error_type in type(e).__mro__:
+                format_message = _ERROR_MESSAGES.get(error_type)
+                if format_message is not None:
+                    error_message = format_message(e)
+                    break
             
             logger.error(f"Error in command {command_name}: {e}")
             await ctx.send(error_message, delete_after=5)
\ No newline at end of file